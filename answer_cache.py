@@ -0,0 +1,156 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    question = " ".join(question.lower().split())
+    return re.sub(r"[\s?!.]+$", "", question)
+
+
+class AnswerCache:
+    """Caches answers per (document, question) with exact and near-duplicate matching
+
+    The exact tier matches normalized question text. The semantic tier compares
+    the question embedding with the cached questions for the same document and
+    reuses an answer when the cosine similarity reaches the threshold. Entries
+    expire after ttl seconds and the least recently used are evicted beyond
+    max_entries.
+    """
+
+    def __init__(self, max_entries=1000, ttl=86400, similarity_threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # (doc_key, normalized question) -> entry
+        self._matrices = {}  # doc_key -> (keys, normalized embedding matrix)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def semantic_enabled(self):
+        return self.similarity_threshold < 1.0
+
+    def _expired(self, entry, now):
+        return self.ttl and now - entry["created_at"] > self.ttl
+
+    def _remove_locked(self, key):
+        self._entries.pop(key, None)
+        self._matrices.pop(key[0], None)
+
+    def get_exact(self, doc_key, question):
+        """Look up a cached answer by normalized question text"""
+        key = (doc_key, normalize_question(question))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove_locked(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return dict(entry["response"])
+            return None
+
+    def get_similar(self, doc_key, embedding):
+        """Look up a cached answer whose question embedding is close enough"""
+        if not self.semantic_enabled or embedding is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            with self._lock:
+                self.misses += 1
+            return None
+        query = query / norm
+
+        now = time.time()
+        with self._lock:
+            keys, matrix = self._doc_matrix_locked(doc_key)
+            if matrix is not None and matrix.shape[1] == query.shape[0]:
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key = keys[best]
+                    entry = self._entries.get(key)
+                    if entry is not None and not self._expired(entry, now):
+                        self._entries.move_to_end(key)
+                        self.semantic_hits += 1
+                        return dict(entry["response"])
+            self.misses += 1
+            return None
+
+    def _doc_matrix_locked(self, doc_key):
+        cached = self._matrices.get(doc_key)
+        if cached is not None:
+            return cached
+        keys, vectors = [], []
+        for key, entry in self._entries.items():
+            if key[0] == doc_key and entry["embedding"] is not None:
+                keys.append(key)
+                vectors.append(entry["embedding"])
+        matrix = np.vstack(vectors) if vectors else None
+        self._matrices[doc_key] = (keys, matrix)
+        return keys, matrix
+
+    def put(self, doc_key, question, response, embedding=None, source=None):
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(embedding)
+            embedding = embedding / norm if norm else None
+        key = (doc_key, normalize_question(question))
+        with self._lock:
+            self._entries[key] = {
+                "response": dict(response),
+                "embedding": embedding,
+                "source": source,
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            self._matrices.pop(doc_key, None)
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._matrices.pop(oldest[0], None)
+                self.evictions += 1
+
+    def invalidate(self, doc_key=None, source=None):
+        """Drop cached answers for a document index, or for every index built from a source PDF"""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if (doc_key is not None and key[0] == doc_key)
+                     or (source is not None and entry["source"] == source)]
+            for key in stale:
+                self._remove_locked(key)
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached answers")
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -1,215 +1,1389 @@
-from flask import Flask, request, jsonify
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-import google.generativeai as genai
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains.question_answering import load_qa_chain
-from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
+import asyncio
+import atexit
+import json
 import logging
 import re
 import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from index_store import IndexStore, file_signature
+from store_registry import VectorStoreRegistry
+from llm_clients import GeminiEmbeddings, LLMClientCache, ModelDiscovery
+from embedding_backends import embedding_tag, make_embeddings
+from pdf_extract import extract_pages
+from text_store import PageTextStore
+from ingest import EmbeddingPipeline
+from jobs import JobManager
+from catalog import PDFCatalog, to_roman
+from answer_cache import AnswerCache, normalize_question
+from embedding_cache import QueryEmbeddingCache
+from singleflight import AsyncSingleFlight, SingleFlight
+from chunking import (ChunkingConfig, ContextPacker, chunk_pages, collapse_overlaps, config_for, load_overrides,
+                      override_for)
+from bm25 import BM25Index
+from retrieval import (RETRIEVAL_MODES, diversify, doc_at, reciprocal_rank_fusion, store_metadatas, store_texts,
+                       vector_search_batch)
+from vector_index import INDEX_TYPES, IndexSpec, build_faiss_store, reconstruct_vectors, spec_for
+from library import MetadataColumns, chunk_metadata, clean_filters, filter_signature
+import metrics
+from metrics import QUERY_PATHS, RETRIEVAL_FALLBACKS, STAGE_SECONDS, stage, trace_id_var
+
+startup = metrics.StartupTimer(_import_started)
+startup.mark("imports")
 
 # Load environment variables
 load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY")
-if api_key:
-    genai.configure(api_key=api_key)
-else:
+if not os.getenv("GOOGLE_API_KEY"):
     logging.warning("GOOGLE_API_KEY not found in environment variables")
 
 app = Flask(__name__)
 CORS(app)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:[%(trace_id)s] %(message)s")
+metrics.install_trace_logging()
 logger = logging.getLogger(__name__)
 
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", "faiss_indexes")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")  # "gemini" or "local" (offline, CPU-only)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/embedding-001")
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "768"))
+TEXT_STORE_DIR = os.getenv("TEXT_STORE_DIR", os.path.join(INDEX_CACHE_DIR, "text"))
+STORE_CACHE_MAX_ENTRIES = int(os.getenv("STORE_CACHE_MAX_ENTRIES", "8"))
+STORE_CACHE_MAX_BYTES = int(os.getenv("STORE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+QUERY_EMBEDDING_CACHE_FILE = os.getenv("QUERY_EMBEDDING_CACHE_FILE", "")  # empty keeps it in memory only
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "2000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+CHUNK_BOUNDARY = os.getenv("CHUNK_BOUNDARY", "none")
+CHUNKING_OVERRIDES_FILE = os.getenv("CHUNKING_OVERRIDES_FILE", "chunking.json")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "12"))
+# MMR trade-off between relevance and diversity of the candidates (1.0 ranks by relevance only),
+# and the cosine similarity to the question below which candidates are dropped (-1 keeps all)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+RETRIEVAL_MIN_SIMILARITY = float(os.getenv("RETRIEVAL_MIN_SIMILARITY", "-1"))
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0")) or None  # 0 picks about 4 * sqrt(chunks)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+PQ_M = int(os.getenv("PQ_M", "0")) or None  # 0 picks dimension / 8 bytes per vector
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+LIBRARY_INDEX_TYPE = os.getenv("LIBRARY_INDEX_TYPE", VECTOR_INDEX_TYPE)
+CHAT_SCOPES = ("book", "course")
+CHAT_SCOPE = os.getenv("CHAT_SCOPE", "course")
+LIBRARY_COMPACT_RATIO = float(os.getenv("LIBRARY_COMPACT_RATIO", "0.25"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+CHAT_MODEL = "gemini-2.0-flash"
+CHAT_TEMPERATURE = 0.3
+
+QA_PROMPT_TEMPLATE = """
+        Context:\n {context}\n
+        Question: \n{question}\n
+
+        Answer the question based on the context provided. If you cannot find the answer in the context, say "I don't have enough information in the provided context to answer this question."
+
+        Answer:
+        """
+
+DIRECT_PROMPT_TEMPLATE = """Context from the document:
+{context}
+
+Question: {question}
+
+Based on the context provided above, please answer the question. If the context doesn't contain enough information to answer the question, please say so.
+
+Answer:"""
+
 class RAGSystem:
-    def __init__(self):
-        self.vector_store = None
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, embedding_model=EMBEDDING_MODEL,
+                 chunk_boundary=CHUNK_BOUNDARY, index_type=VECTOR_INDEX_TYPE, catalog=None,
+                 embedding_backend=EMBEDDING_BACKEND):
         self.current_pdf = None
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+        self.current_index = None  # used only when a request does not name a PDF
+        self.chunking = ChunkingConfig(chunk_size, chunk_overlap, chunk_boundary)
+        self.chunking_overrides = load_overrides(CHUNKING_OVERRIDES_FILE)
+        self.index_spec = IndexSpec(index_type, nlist=IVF_NLIST, pq_m=PQ_M, hnsw_m=HNSW_M,
+                                    nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+        self.library_spec = IndexSpec(LIBRARY_INDEX_TYPE, nlist=IVF_NLIST, pq_m=PQ_M, hnsw_m=HNSW_M,
+                                      nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+        self.catalog = catalog if catalog is not None else PDFCatalog("static2")
+        self._library_key = None  # ((embedding model, file signatures), key)
+        self._stale_library_key = None
+        self.on_library_stale = None  # called to start updating an out-of-date library index
+        self.context_packer = ContextPacker(CONTEXT_TOKEN_BUDGET)
+        self.retrieval_mode = RETRIEVAL_MODE
+        self.embeddings = make_embeddings(embedding_backend, embedding_model, LOCAL_EMBEDDING_DIM)
+        self.index_store = IndexStore(INDEX_CACHE_DIR)
+        self.text_store = PageTextStore(TEXT_STORE_DIR)
+        self.store_registry = VectorStoreRegistry(STORE_CACHE_MAX_ENTRIES, STORE_CACHE_MAX_BYTES)
+        self.llm_clients = LLMClientCache()
+        self.answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
+        self.questions_in_flight = SingleFlight("question")
+        self.questions_in_flight_async = AsyncSingleFlight("question")
+        self.builds_in_flight = SingleFlight("ingest")
+        self.query_embeddings = QueryEmbeddingCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_FILE or None)
+        self.embedding_pipeline = EmbeddingPipeline(
+            self.embeddings,
+            batch_size=EMBED_BATCH_SIZE,
+            max_concurrency=EMBED_CONCURRENCY,
+            max_retries=EMBED_MAX_RETRIES,
+            checkpoint_dir=os.path.join(INDEX_CACHE_DIR, ".checkpoints"),
+        )
+
+    @property
+    def embedding_model(self):
+        """Tag of the embeddings in use; part of every index key and saved with every index"""
+        return embedding_tag(self.embeddings)
+
+    def chunking_for(self, pdf_path=None):
+        """Chunking config for a PDF, honouring per-document overrides"""
+        if not pdf_path:
+            return self.chunking
+        return config_for(pdf_path, self.chunking, self.chunking_overrides)
+
+    def index_spec_for(self, pdf_path=None):
+        """Vector index type for a PDF, honouring per-document overrides"""
+        if not pdf_path:
+            return self.index_spec
+        return spec_for(override_for(pdf_path, self.chunking_overrides), self.index_spec)
+
+    def index_params(self, pdf_path=None, index_spec=None):
+        """Parameters that change the contents of a built index"""
+        index_spec = index_spec or self.index_spec_for(pdf_path)
+        return dict(self.chunking_for(pdf_path).to_dict(), embedding_model=self.embedding_model,
+                    **index_spec.to_dict())
+
+    def index_loader(self, index_key):
+        """Loader for the store registry that reads an index from the cache directory"""
+        def loader():
+            tag = (self.index_store.read_metadata(index_key) or {}).get("embedding_model")
+            if tag and tag != self.embedding_model:
+                raise ValueError(f"Index {index_key} holds {tag} vectors, but the embeddings in use are "
+                                 f"{self.embedding_model}")
+            with stage("index_load"):
+                store = self.index_store.load(index_key, self.embeddings)
+            # nprobe / efSearch are search settings, so they follow the current configuration
+            self.index_spec.configure(store.index)
+            return store, self.index_store.index_size(index_key)
+        return loader
+
+    def get_vector_store(self, index_key):
+        """Return a loaded vector store, reading it from disk only if it is not resident"""
+        return self.store_registry.get(index_key, self.index_loader(index_key))
+
+    def get_lexical_index(self, index_key, vector_store):
+        """Return the BM25 index for a vector index, building it for builds that predate it"""
+        def loader():
+            lexical_index = self.index_store.load_lexical(index_key)
+            if lexical_index is None:
+                logger.info(f"Building missing BM25 index for {index_key}")
+                lexical_index = BM25Index.build(store_texts(vector_store))
+                self.index_store.save_lexical(index_key, lexical_index)
+            return lexical_index, lexical_index.nbytes()
+        return self.store_registry.get(f"{index_key}:bm25", loader)
+
+    def get_library_columns(self, index_key, vector_store):
+        """Return the metadata columns used to filter a library index"""
+        def loader():
+            columns = MetadataColumns(store_metadatas(vector_store))
+            return columns, columns.nbytes()
+        return self.store_registry.get(f"{index_key}:columns", loader)
+
+    def resolve_index(self, pdf_path=None):
+        """Return the index key for a PDF (default: the last loaded one), or None if it is not indexed"""
+        pdf_path = pdf_path or self.current_pdf
+        if not pdf_path or not os.path.exists(pdf_path):
+            return None
+        index_key = self.index_store.index_key(pdf_path, self.index_params(pdf_path))
+        if self.store_registry.peek(index_key) is None and not self.index_store.exists(index_key):
+            return None
+        return index_key
         
-    def get_pdf_text(self, pdf_path):
-        """Extract text from PDF file"""
-        text = ""
+    def get_pdf_pages(self, pdf_path):
+        """Yield (page_number, text) for each page of a PDF file
+
+        Pages come from the text store when this content has been parsed
+        before; otherwise the PDF is parsed and its text stored on the way.
+        """
+        content_hash = self.index_store.file_hash(pdf_path)
+        if self.text_store.has(content_hash):
+            return self.text_store.iter_pages(content_hash)
+        return self.text_store.write_through(content_hash, extract_pages(pdf_path, workers=PDF_EXTRACT_WORKERS))
+
+    def read_pdf_pages(self, pdf_path, progress=None):
+        """Yield (page_number, text) for each page of a PDF file as it is read, reporting progress
+
+        Time spent waiting for pages is recorded as the pdf_extract (or
+        text_load) stage, although they are consumed as they arrive.
+        """
+        stored = self.text_store.has(self.index_store.file_hash(pdf_path))
+        pages = iter(self.get_pdf_pages(pdf_path))
+        seconds = 0.0
         try:
-            pdf_reader = PdfReader(pdf_path)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-            return text
+            while True:
+                started = time.perf_counter()
+                page = next(pages, None)
+                seconds += time.perf_counter() - started
+                if page is None:
+                    return
+                if progress:
+                    progress(pages_extracted=page[0])
+                yield page
+        finally:
+            STAGE_SECONDS.observe(seconds, stage="text_load" if stored else "pdf_extract")
+
+    def get_pdf_page_list(self, pdf_path, progress=None):
+        """Extract all (page_number, text) pages of a PDF file, reporting progress"""
+        try:
+            return list(self.read_pdf_pages(pdf_path, progress))
         except Exception as e:
             logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
             return None
 
-    def get_text_chunks(self, text):
-        """Split text into chunks"""
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=10000, chunk_overlap=1000)
-        chunks = text_splitter.split_text(text)
-        return chunks
+    def get_pdf_text(self, pdf_path, progress=None):
+        """Extract text from PDF file"""
+        pages = self.get_pdf_page_list(pdf_path, progress)
+        if pages is None:
+            return None
+        return "".join(text for _, text in pages)
 
-    def create_vector_store(self, text_chunks):
-        """Create and save vector store"""
+    def get_page_chunks(self, pages, config=None):
+        """Split (page_number, text) pages into chunks, returning (texts, metadatas) with page ranges
+
+        pages may be an iterator, e.g. from read_pdf_pages, so that a whole book's
+        text is never held at once; the chunking stage then includes reading it.
+        """
+        with stage("chunking"):
+            return chunk_pages(pages, config or self.chunking)
+
+    def create_vector_store(self, text_chunks, index_key, metadata=None, progress=None, chunk_metadatas=None,
+                            index_spec=None, vectors=None, ids=None):
+        """Create vector store and save it in the index cache
+
+        vectors may be passed in to skip embedding, e.g. when an existing build
+        is retrained with another index type. ids are the chunks' document IDs
+        (random by default).
+        """
         try:
-            self.vector_store = FAISS.from_texts(text_chunks, embedding=self.embeddings)
-            self.vector_store.save_local("faiss_index")
+            if vectors is None:
+                with stage("embedding"):
+                    vectors = self.embedding_pipeline.embed(text_chunks, checkpoint_key=index_key, progress=progress)
+            with stage("index_build"):
+                vector_store, index_info = build_faiss_store(self.embeddings, text_chunks, vectors, chunk_metadatas,
+                                                             index_spec or self.index_spec, ids)
+                lexical_index = BM25Index.build(text_chunks)
+            metadata = dict(metadata or {}, **index_info)
+            with stage("index_save"):
+                self.index_store.save(index_key, vector_store, metadata, lexical_index)
+            self.embedding_pipeline.clear_checkpoint(index_key)
+            self.store_registry.put(index_key, vector_store, self.index_store.index_size(index_key))
             return True
         except Exception as e:
             logger.error(f"Error creating vector store: {str(e)}")
             return False
 
     def get_conversational_chain(self):
-        """Create conversational chain"""
-        prompt_template = """
-        Context:\n {context}\n
-        Question: \n{question}\n
+        """Get the shared conversational chain"""
+        try:
+            return self.llm_clients.get_qa_chain(CHAT_MODEL, CHAT_TEMPERATURE, QA_PROMPT_TEMPLATE)
+        except Exception as e:
+            logger.error(f"Error creating Google Generative AI model: {e}")
+            raise Exception(f"Failed to initialize Gemini model: {str(e)}")
 
-        Answer the question based on the context provided. If you cannot find the answer in the context, say "I don't have enough information in the provided context to answer this question."
+    def is_indexed(self, pdf_path):
+        """Whether an index for this PDF is already in the cache"""
+        return self.index_store.exists(self.index_store.index_key(pdf_path, self.index_params(pdf_path)))
 
-        Answer:
-        """
+    def build_index(self, pdf_path, progress=None):
+        """Make sure an index for the PDF exists in the cache and return its key"""
+        if not os.path.exists(pdf_path):
+            logger.error(f"PDF not found: {pdf_path}")
+            return None
+        
+        # Reuse a previously built index for the same content and parameters
+        params = self.index_params(pdf_path)
+        index_key = self.index_store.index_key(pdf_path, params)
+        if self.index_store.exists(index_key):
+            return index_key
+        # Concurrent requests for the same build wait for the first one
+        return self.builds_in_flight.do(index_key, lambda: self.build_new_index(pdf_path, index_key, params, progress))
 
+    def build_new_index(self, pdf_path, index_key, params, progress=None):
+        """Build and save the index for a PDF under index_key"""
+        if self.index_store.exists(index_key):
+            return index_key
+        
+        # An index of another type for the same chunks already holds the vectors
+        index_spec = self.index_spec_for(pdf_path)
+        metadata = dict(params, source_pdf=pdf_path)
+        reusable = self.reusable_vectors(pdf_path, index_key)
+        if reusable is not None:
+            text_chunks, chunk_metadatas, vectors = reusable
+            metadata["chunk_count"] = len(text_chunks)
+            if not self.create_vector_store(text_chunks, index_key, metadata, chunk_metadatas=chunk_metadatas,
+                                            index_spec=index_spec, vectors=vectors):
+                return None
+            return index_key
+        
+        # Chunk the text page by page as it is extracted, keeping the pages each chunk came from
         try:
-            model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3)
-            prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-            
+            text_chunks, chunk_metadatas = self.get_page_chunks(self.read_pdf_pages(pdf_path, progress),
+                                                                self.chunking_for(pdf_path))
+        except Exception as e:
+            logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
+            return None
+        if not text_chunks:
+            return None
+        if progress:
+            progress(total_chunks=len(text_chunks), chunks_embedded=0)
+        
+        # Create vector store
+        metadata["chunk_count"] = len(text_chunks)
+        embedded = (lambda count: progress(chunks_embedded=count)) if progress else None
+        if not self.create_vector_store(text_chunks, index_key, metadata, embedded, chunk_metadatas, index_spec):
+            return None
+        # Answers cached for an older build of this PDF are stale now
+        self.answer_cache.invalidate(source=pdf_path)
+        logger.info(f"Successfully processed PDF: {pdf_path}")
+        return index_key
+
+    def reusable_vectors(self, pdf_path, index_key):
+        """(texts, metadatas, vectors) from a build of the same chunks with another index type, or None"""
+        for index_type in INDEX_TYPES:
+            params = self.index_params(pdf_path, IndexSpec(index_type))
+            other_key = self.index_store.index_key(pdf_path, params)
+            if other_key == index_key or not self.index_store.exists(other_key):
+                continue
             try:
-                chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
-                return chain
+                text_chunks, chunk_metadatas, vectors = self.stored_chunks(other_key)
             except Exception as e:
-                logger.error(f"Error creating chain with custom prompt: {e}")
-                # Fallback to default chain
-                return load_qa_chain(model, chain_type="stuff")
-        except Exception as e:
-            logger.error(f"Error creating Google Generative AI model: {e}")
-            raise Exception(f"Failed to initialize Gemini model: {str(e)}")
+                logger.warning(f"Could not reuse index {other_key}: {str(e)}")
+                continue
+            if vectors is None:
+                continue
+            logger.info(f"Rebuilding {pdf_path} as {self.index_spec_for(pdf_path).index_type} from index {other_key}")
+            return text_chunks, chunk_metadatas, vectors
+        return None
+
+    def stored_chunks(self, index_key):
+        """(texts, metadatas, vectors) of a saved index; vectors is None if the index is compressed"""
+        store = self.index_store.load(index_key, self.embeddings)
+        vectors = reconstruct_vectors(store.index)
+        return store_texts(store), store_metadatas(store), vectors
+
+    def library_key(self):
+        """Cache key of the library index for the PDFs currently in the catalog
+
+        Hashing every book is O(catalog size), so the key is kept while every
+        book keeps its size and mtime (and the embeddings do not change). A
+        book overwritten in place gets a new mtime even though the folder's
+        does not change.
+        """
+        entries = self.catalog.entries()
+        signature = (self.embedding_model, tuple(file_signature(entry["path"]) for entry in entries))
+        cached = self._library_key
+        if cached and cached[0] == signature:
+            return cached[1]
+        # The path is part of each book's key: chunks carry it (and the book and author parsed from it)
+        books = [(entry["path"], dict(self.chunking_for(entry["path"]).to_dict(), embedding_model=self.embedding_model,
+                                      source_pdf=entry["path"]))
+                 for entry in entries]
+        index_key = self.index_store.library_key(books, dict(self.library_spec.to_dict(), library=True))
+        self._library_key = (signature, index_key)
+        return index_key
+
+    def resolve_library(self, start_update=False):
+        """Return the key of the library index to search, or None if none has been built
+
+        When the catalog has changed since the last build, the last published
+        library keeps serving until its update is published. With
+        start_update (questions, not status reads), on_library_stale is
+        called once per new set of PDFs to start that update.
+        """
+        if not self.catalog.entries():
+            return None
+        index_key = self.library_key()
+        if self.store_registry.peek(index_key) is not None or self.index_store.exists(index_key):
+            return index_key
+        published = self.index_store.read_pointer("library")
+        if not published or not self.index_store.exists(published):
+            return None
+        if start_update and self.on_library_stale and self._stale_library_key != index_key:
+            self._stale_library_key = index_key
+            logger.info(f"Library index {published} is out of date, serving it until the update is published")
+            self.on_library_stale()
+        return published
+
+    def library_is_current(self, index_key):
+        """Whether a library index covers the PDFs currently in the catalog"""
+        return index_key == self.library_key()
+
+    def book_index_keys(self, library_key):
+        """Keys of the book indexes a library build was made from"""
+        members = (self.index_store.read_metadata(library_key) or {}).get("members") or {}
+        return {member["index_key"] for member in members.values() if member.get("index_key")}
+
+    def build_library(self, progress=None):
+        """Index every catalog PDF into one library index with per-chunk book metadata
+
+        Books are indexed on their own first (or reused from the cache), and
+        their vectors are copied into the library so nothing is embedded twice.
+        When an earlier library build exists, only the books that were added,
+        changed or removed since are applied to it.
+        """
+        entries = self.catalog.entries()
+        index_key = self.library_key()
+        if self.index_store.exists(index_key):
+            return index_key
+        return self.builds_in_flight.do(index_key, lambda: self.build_new_library(index_key, entries, progress))
+
+    def build_new_library(self, index_key, entries, progress=None):
+        if self.index_store.exists(index_key):
+            return index_key
+        previous_key = self.index_store.read_pointer("library")
+        if previous_key and previous_key != index_key and self.index_store.exists(previous_key):
+            try:
+                updated = self.update_library(previous_key, index_key, entries, progress)
+            except Exception as e:
+                logger.warning(f"Incremental update of library index {previous_key} failed: {str(e)}")
+                updated = None
+            if updated:
+                return updated
+        return self.rebuild_library(index_key, entries, progress)
+
+    def library_book_id(self, entry):
+        """Identifies one version of a catalog book: its path, content hash and chunking"""
+        params = dict(self.chunking_for(entry["path"]).to_dict(), embedding_model=self.embedding_model,
+                      source_pdf=entry["path"])
+        return self.index_store.index_key(entry["path"], params)[:16]
+
+    def book_index_key(self, entry):
+        """Key of the index of a catalog book on its own"""
+        return self.index_store.index_key(entry["path"], self.index_params(entry["path"]))
+
+    def library_book(self, entry):
+        """(texts, metadatas, vectors) of a catalog book for the library index, or None if it cannot be indexed"""
+        book_key = self.build_index(entry["path"])
+        if not book_key:
+            logger.warning(f"Leaving {entry['filename']} out of the library index")
+            return None
+        book_texts, book_metadatas, vectors = self.stored_chunks(book_key)
+        if vectors is None:
+            vectors = self.embedding_pipeline.embed(book_texts, checkpoint_key=book_key)
+            self.embedding_pipeline.clear_checkpoint(book_key)
+        return book_texts, [chunk_metadata(entry, metadata) for metadata in book_metadatas], np.asarray(vectors)
+
+    def rebuild_library(self, index_key, entries, progress=None):
+        """Build the library index from all of its books"""
+        texts, metadatas, vector_parts, ids, members = [], [], [], [], {}
+        if progress:
+            progress(total_books=len(entries), books_indexed=0)
+        for number, entry in enumerate(entries, 1):
+            book = self.library_book(entry)
+            if book is not None:
+                book_id = self.library_book_id(entry)
+                book_texts, book_metadatas, vectors = book
+                texts.extend(book_texts)
+                metadatas.extend(book_metadatas)
+                vector_parts.append(vectors)
+                ids.extend(f"{book_id}:{n}" for n in range(len(book_texts)))
+                members[book_id] = {"filename": entry["filename"], "chunks": len(book_texts),
+                                    "index_key": self.book_index_key(entry)}
+            if progress:
+                progress(books_indexed=number)
+        if not texts:
+            return None
+        
+        metadata = dict(self.library_spec.to_dict(), library=True, spec=self.library_spec.to_dict(),
+                        embedding_model=self.embedding_model,
+                        books=[member["filename"] for member in members.values()], members=members,
+                        chunk_count=len(texts), deleted_chunks=0, churn=0)
+        if not self.create_vector_store(texts, index_key, metadata, chunk_metadatas=metadatas,
+                                        index_spec=self.library_spec, vectors=np.vstack(vector_parts), ids=ids):
+            return None
+        self.publish_library(index_key)
+        logger.info(f"Built library index {index_key} over {len(members)} PDFs")
+        return index_key
 
-    def load_and_process_pdf(self, pdf_path):
+    def update_library(self, previous_key, index_key, entries, progress=None):
+        """Apply catalog changes to an earlier library build; returns the new key, or None to rebuild
+
+        Vectors of removed or changed books are deleted by document ID: they
+        stay in the index but are excluded from every search. Added or changed
+        books are embedded on their own (or reused from their book index) and
+        appended. Once the chunks added and deleted since the index was
+        trained exceed LIBRARY_COMPACT_RATIO of it, it is compacted.
+        """
+        meta = self.index_store.read_metadata(previous_key) or {}
+        if ("members" not in meta or meta.get("spec") != self.library_spec.to_dict()
+                or meta.get("embedding_model") != self.embedding_model):
+            # Built before incremental updates, or with another index type or embedding model
+            return None
+        wanted = {self.library_book_id(entry): entry for entry in entries}
+        members = dict(meta["members"])
+        removed = [book_id for book_id in members if book_id not in wanted]
+        added = [book_id for book_id in wanted if book_id not in members]
+        logger.info(f"Updating library index {previous_key}: {len(added)} books to add, {len(removed)} to remove")
+        
+        with stage("index_load"):
+            store = self.index_store.load(previous_key, self.embeddings)
+            lexical_index = self.index_store.load_lexical(previous_key) or BM25Index.build(store_texts(store))
+        
+        deleted = 0
+        for book_id in removed:
+            for n in range(members.pop(book_id)["chunks"]):
+                store.docstore.search(f"{book_id}:{n}").metadata["deleted"] = True
+                deleted += 1
+        
+        appended = 0
+        if progress:
+            progress(total_books=len(added), books_indexed=0)
+        for number, book_id in enumerate(added, 1):
+            book = self.library_book(wanted[book_id])
+            if book is not None:
+                book_texts, book_metadatas, vectors = book
+                with stage("index_build"):
+                    store.add_embeddings(zip(book_texts, vectors.tolist()), metadatas=book_metadatas,
+                                         ids=[f"{book_id}:{n}" for n in range(len(book_texts))])
+                    lexical_index.extend(book_texts)
+                members[book_id] = {"filename": wanted[book_id]["filename"], "chunks": len(book_texts),
+                                    "index_key": self.book_index_key(wanted[book_id])}
+                appended += len(book_texts)
+            if progress:
+                progress(books_indexed=number)
+        
+        live_chunks = sum(member["chunks"] for member in members.values())
+        if not live_chunks:
+            return None
+        metadata = {k: v for k, v in meta.items() if k not in ("key", "created_at")}
+        metadata.update(books=[member["filename"] for member in members.values()], members=members,
+                        chunk_count=live_chunks, deleted_chunks=meta.get("deleted_chunks", 0) + deleted,
+                        churn=meta.get("churn", 0) + deleted + appended)
+        if metadata["churn"] > LIBRARY_COMPACT_RATIO * live_chunks:
+            return self.compact_library(store, index_key, metadata)
+        
+        with stage("index_save"):
+            self.index_store.save(index_key, store, metadata, lexical_index)
+        self.index_spec.configure(store.index)
+        self.store_registry.put(index_key, store, self.index_store.index_size(index_key))
+        self.publish_library(index_key)
+        logger.info(f"Updated library index {index_key}: {appended} chunks added, {deleted} deleted")
+        return index_key
+
+    def compact_library(self, store, index_key, metadata):
+        """Rebuild a library store from its live chunks, retraining the index without embedding anything
+
+        Returns None when the index cannot give back its vectors (PQ), so
+        the caller rebuilds from the book indexes instead.
+        """
+        vectors = reconstruct_vectors(store.index)
+        if vectors is None:
+            return None
+        live = [position for position in range(store.index.ntotal)
+                if not doc_at(store, position).metadata.get("deleted")]
+        docs = [doc_at(store, position) for position in live]
+        ids = [store.index_to_docstore_id[position] for position in live]
+        metadata = dict(metadata, chunk_count=len(live), deleted_chunks=0, churn=0)
+        if not self.create_vector_store([doc.page_content for doc in docs], index_key, metadata,
+                                        chunk_metadatas=[doc.metadata for doc in docs],
+                                        index_spec=self.library_spec, vectors=vectors[live], ids=ids):
+            return None
+        self.publish_library(index_key)
+        logger.info(f"Compacted library index {index_key} to {len(live)} chunks")
+        return index_key
+
+    def publish_library(self, index_key):
+        """Record the newest library build and delete the one it replaces
+
+        Indexes of books that were removed or changed since the replaced build
+        are deleted with it, unless one is the currently loaded PDF's.
+        """
+        previous_key = self.index_store.read_pointer("library")
+        self.index_store.write_pointer("library", index_key)
+        if not previous_key or previous_key == index_key:
+            return
+        dropped = self.book_index_keys(previous_key) - self.book_index_keys(index_key) - {self.current_index}
+        for key in [previous_key, *dropped]:
+            self.store_registry.discard(key)
+            self.index_store.remove(key)
+        if dropped:
+            logger.info(f"Removed {len(dropped)} indexes of books no longer in the library")
+
+    def load_and_process_pdf(self, pdf_path, progress=None):
         """Load and process PDF for RAG"""
         try:
-            if not os.path.exists(pdf_path):
-                logger.error(f"PDF not found: {pdf_path}")
-                return False
-            
-            # Extract text from PDF
-            raw_text = self.get_pdf_text(pdf_path)
-            if not raw_text:
+            index_key = self.build_index(pdf_path, progress)
+            if not index_key:
                 return False
             
-            # Create text chunks
-            text_chunks = self.get_text_chunks(raw_text)
-            
-            # Create vector store
-            success = self.create_vector_store(text_chunks)
-            if success:
-                self.current_pdf = pdf_path
-                logger.info(f"Successfully processed PDF: {pdf_path}")
-                return True
-            return False
+            # Load the store now so the first question does not wait on it
+            self.get_vector_store(index_key)
+            self.current_index = index_key
+            self.current_pdf = pdf_path
+            return True
             
         except Exception as e:
             logger.error(f"Error processing PDF {pdf_path}: {str(e)}")
             return False
 
-    def query(self, user_question):
-        """Query the RAG system"""
+    def resolve_scope(self, pdf_path=None, filters=None, retrieval_mode=None):
+        """Return (index_key, cache_key, source_pdf) for one PDF, or for the library when filters is given"""
+        if filters is None:
+            source_pdf = pdf_path or self.current_pdf
+            index_key = self.resolve_index(source_pdf)
+            return index_key, index_key and self.answer_key(index_key, retrieval_mode), source_pdf
+        index_key = self.resolve_library(start_update=True)
+        cache_key = index_key and self.answer_key(f"{index_key}:{filter_signature(filters)}", retrieval_mode)
+        return index_key, cache_key, None
+
+    def answer_key(self, scope_key, retrieval_mode=None):
+        """Answer cache key for an index (and filters) and the settings that pick the chunks an answer uses"""
+        settings = (retrieval_mode or self.retrieval_mode, RETRIEVAL_CANDIDATES, MMR_LAMBDA, RETRIEVAL_MIN_SIMILARITY,
+                    self.context_packer.token_budget)
+        return ":".join(map(str, (scope_key, *settings)))
+
+    def scope_error(self, filters, docs=None):
+        """Error response when a question has no index, or the library has no matching chunks"""
+        if filters is None:
+            return {"error": "No PDF loaded. Please load a PDF first."}
+        if docs is None:
+            return {"error": "The library index has not been built yet."}
+        return {"error": "No indexed books match the requested filters", "filters": filters}
+
+    def query(self, user_question, pdf_path=None, retrieval_mode=None, filters=None):
+        """Query the RAG system about one PDF (default: the last loaded one)
+
+        With filters, the question is answered from the library index instead,
+        using the chunks of every book matching the filters. Identical
+        questions asked at the same time share one retrieval and generation.
+        """
         try:
-            if not os.path.exists("faiss_index"):
-                return {"error": "No PDF loaded. Please load a PDF first."}
+            index_key, cache_key, source_pdf = self.resolve_scope(pdf_path, filters, retrieval_mode)
+            if not index_key:
+                return self.scope_error(filters)
+            
+            response = self.questions_in_flight.do(
+                self.question_key(cache_key, user_question),
+                lambda: self.answer(index_key, cache_key, source_pdf, user_question, retrieval_mode, filters))
+            return dict(response)
+            
+        except Exception as e:
+            logger.error(f"Error querying RAG system: {str(e)}")
+            return {"error": f"Error processing query: {str(e)}"}
+
+    async def aquery(self, user_question, pdf_path=None, retrieval_mode=None, filters=None):
+        """query() for the event loop; the only blocking work (hashing, searching) runs in threads"""
+        try:
+            index_key, cache_key, source_pdf = await asyncio.to_thread(self.resolve_scope, pdf_path, filters,
+                                                                       retrieval_mode)
+            if not index_key:
+                return self.scope_error(filters)
+            
+            response = await self.questions_in_flight_async.do(
+                self.question_key(cache_key, user_question),
+                lambda: self.aanswer(index_key, cache_key, source_pdf, user_question, retrieval_mode, filters))
+            return dict(response)
             
-            # Load vector store
+        except Exception as e:
+            logger.error(f"Error querying RAG system: {str(e)}")
+            return {"error": f"Error processing query: {str(e)}"}
+
+    def question_key(self, cache_key, user_question):
+        """Questions with the same key get the same answer; cache_key already names the retrieval settings"""
+        return cache_key, normalize_question(user_question)
+
+    def answer(self, index_key, cache_key, source_pdf, user_question, retrieval_mode=None, filters=None):
+        """Answer a question against a resolved index, from the cache or by generating it"""
+        cached, docs, question_embedding = self.retrieve(index_key, user_question, retrieval_mode, filters, cache_key)
+        if cached is not None:
+            return cached
+        if filters is not None:
+            if not docs:
+                return self.scope_error(filters, docs)
+            source_pdf = docs[0].metadata.get("source_pdf")
+        
+        response = self.generate_answer(user_question, docs, source_pdf)
+        self.remember_answer(cache_key, user_question, response, question_embedding, docs, source_pdf, filters,
+                             retrieval_mode)
+        return response
+
+    async def aanswer(self, index_key, cache_key, source_pdf, user_question, retrieval_mode=None, filters=None):
+        cached, docs, question_embedding = await self.aretrieve(index_key, user_question, retrieval_mode, filters,
+                                                                cache_key)
+        if cached is not None:
+            return cached
+        if filters is not None:
+            if not docs:
+                return self.scope_error(filters, docs)
+            source_pdf = docs[0].metadata.get("source_pdf")
+        
+        response = await self.agenerate_answer(user_question, docs, source_pdf)
+        self.remember_answer(cache_key, user_question, response, question_embedding, docs, source_pdf, filters,
+                             retrieval_mode)
+        return response
+
+    def remember_answer(self, cache_key, user_question, response, question_embedding, docs, source_pdf, filters,
+                        retrieval_mode=None):
+        """Cache a successful answer; library answers also list the books they came from"""
+        if "error" in response:
+            return
+        if question_embedding is None and (retrieval_mode or self.retrieval_mode) != "lexical":
+            # Retrieval fell back to lexical search, so the answer is not one for this mode's cache key
+            return
+        if filters is not None:
+            response["sources"] = library_sources(docs)
+        self.answer_cache.put(cache_key, user_question, response, question_embedding,
+                              source_pdf if filters is None else None)
+
+    def retrieve(self, index_key, user_question, retrieval_mode=None, filters=None, cache_key=None):
+        """Return (cached_response, docs, question_embedding) for a question against an index
+
+        filters restricts a library index to matching chunks; cache_key
+        separates cached answers for different filters of the same index.
+        """
+        cache_key = cache_key or self.answer_key(index_key, retrieval_mode)
+        # Repeated questions about the same book are answered from the cache
+        cached = self.cached_answer(cache_key, user_question)
+        if cached is not None:
+            return cached, None, None
+        
+        # Embed the question once for both the semantic cache and the search.
+        # Lexical mode, or an unreachable embeddings API, skips the remote call.
+        mode = retrieval_mode or self.retrieval_mode
+        question_embedding = None
+        if mode != "lexical":
             try:
-                new_db = FAISS.load_local("faiss_index", self.embeddings, allow_dangerous_deserialization=True)
-            except TypeError:
-                # Fallback for older FAISS versions
-                new_db = FAISS.load_local("faiss_index", self.embeddings)
+                question_embedding = self.embed_question(user_question)
+            except Exception as e:
+                logger.warning(f"Question embedding failed, using lexical retrieval: {str(e)}")
+                RETRIEVAL_FALLBACKS.inc(reason="embedding_failed")
+                mode = "lexical"
+        cached = self.similar_answer(cache_key, question_embedding)
+        if cached is not None:
+            return cached, None, question_embedding
+        
+        docs = self.search(index_key, user_question, mode, question_embedding, filters)
+        return None, docs, question_embedding
+
+    async def aretrieve(self, index_key, user_question, retrieval_mode=None, filters=None, cache_key=None):
+        """retrieve() for the event loop: the embedding call is awaited and the search runs in a thread"""
+        cache_key = cache_key or self.answer_key(index_key, retrieval_mode)
+        cached = self.cached_answer(cache_key, user_question)
+        if cached is not None:
+            return cached, None, None
+        
+        mode = retrieval_mode or self.retrieval_mode
+        question_embedding = None
+        if mode != "lexical":
+            try:
+                question_embedding = await self.aembed_question(user_question)
+            except Exception as e:
+                logger.warning(f"Question embedding failed, using lexical retrieval: {str(e)}")
+                RETRIEVAL_FALLBACKS.inc(reason="embedding_failed")
+                mode = "lexical"
+        cached = self.similar_answer(cache_key, question_embedding)
+        if cached is not None:
+            return cached, None, question_embedding
+        
+        docs = await asyncio.to_thread(self.search, index_key, user_question, mode, question_embedding, filters)
+        return None, docs, question_embedding
+
+    def cached_answer(self, cache_key, user_question):
+        """A cached answer to the same question, after normalization"""
+        cached = self.answer_cache.get_exact(cache_key, user_question)
+        if cached is not None:
+            cached["cache_hit"] = "exact"
+            QUERY_PATHS.inc(path="cache_exact")
+        return cached
+
+    def similar_answer(self, cache_key, question_embedding):
+        """A cached answer to a question whose embedding is close enough"""
+        cached = self.answer_cache.get_similar(cache_key, question_embedding)
+        if cached is not None:
+            cached["cache_hit"] = "semantic"
+            QUERY_PATHS.inc(path="cache_semantic")
+        return cached
+
+    def search(self, index_key, user_question, mode, question_embedding, filters=None):
+        """Rank chunks of an index for a question and pack the best into the token budget"""
+        return self.search_batch(index_key, [user_question], mode, [question_embedding], filters)[0]
+
+    def search_batch(self, index_key, questions, mode, question_embeddings, filters=None):
+        """search() for many questions, with one FAISS search over all their embeddings"""
+        # Many readers can search the same store at once
+        with self.store_registry.reading(index_key, self.index_loader(index_key)) as new_db:
+            positions = None
+            if filters is not None:
+                positions = self.get_library_columns(index_key, new_db).positions(filters)
+            vector_hits = lexical_hits = [[] for _ in questions]
+            if mode != "lexical":
+                with stage("vector_search"):
+                    vector_hits = vector_search_batch(new_db, question_embeddings, RETRIEVAL_CANDIDATES, positions)
+            if mode != "vector":
+                lexical_index = self.get_lexical_index(index_key, new_db)
+                with stage("lexical_search"):
+                    lexical_hits = [lexical_index.search(question, RETRIEVAL_CANDIDATES, positions)
+                                    for question in questions]
             
-            # Search for similar documents
-            docs = new_db.similarity_search(user_question, k=3)
+            candidate_lists = []
+            for question_embedding, vector_ranked, lexical_ranked in zip(question_embeddings, vector_hits,
+                                                                         lexical_hits):
+                if mode == "hybrid":
+                    ranked = reciprocal_rank_fusion([[p for p, _ in vector_ranked], [p for p, _ in lexical_ranked]])
+                elif mode == "lexical":
+                    ranked = lexical_ranked
+                else:
+                    # Negate distances so that higher is better for every mode
+                    ranked = [(p, -distance) for p, distance in vector_ranked]
+                ranked = ranked[:RETRIEVAL_CANDIDATES]
+                if mode != "lexical" and question_embedding is not None:
+                    # Prefer candidates that add something the better ones do not already say
+                    with stage("diversify"):
+                        ranked = diversify(new_db, question_embedding, ranked, MMR_LAMBDA,
+                                           RETRIEVAL_MIN_SIMILARITY)
+                candidate_lists.append([(doc_at(new_db, position), score) for position, score in ranked])
+        
+        # Merge overlapping neighbours, then keep the best chunks that fit the prompt's token budget
+        with stage("context_packing"):
+            return [self.context_packer.pack(collapse_overlaps(candidates), ranked=True)
+                    for candidates in candidate_lists]
+
+    def query_batch(self, questions, pdf_path=None, retrieval_mode=None):
+        """Answer many questions about one PDF, returning one response per question, in order
+
+        Uncached questions are embedded in one call and searched in one FAISS
+        search; answers are generated concurrently, up to BATCH_CONCURRENCY at
+        a time. A failing question gets an error response without affecting
+        the others.
+        """
+        index_key, cache_key, source_pdf = self.resolve_scope(pdf_path, retrieval_mode=retrieval_mode)
+        if not index_key:
+            return [self.scope_error(None) for _ in questions]
+        
+        results = [self.cached_answer(cache_key, question) for question in questions]
+        pending = [i for i, result in enumerate(results) if result is None]
+        mode = retrieval_mode or self.retrieval_mode
+        question_embeddings = [None] * len(questions)
+        if pending and mode != "lexical":
+            try:
+                embedded = self.embed_questions([questions[i] for i in pending])
+                for i, embedding in zip(pending, embedded):
+                    question_embeddings[i] = embedding
+            except Exception as e:
+                logger.warning(f"Question embedding failed, using lexical retrieval: {str(e)}")
+                RETRIEVAL_FALLBACKS.inc(reason="embedding_failed")
+                mode = "lexical"
+        for i in pending:
+            results[i] = self.similar_answer(cache_key, question_embeddings[i])
+        pending = [i for i in pending if results[i] is None]
+        if not pending:
+            return results
+        
+        try:
+            found = self.search_batch(index_key, [questions[i] for i in pending], mode,
+                                      [question_embeddings[i] for i in pending])
+        except Exception as e:
+            logger.error(f"Batch retrieval failed: {str(e)}")
+            for i in pending:
+                results[i] = {"error": f"Error processing query: {str(e)}"}
+            return results
+        
+        def answer(i, docs):
+            try:
+                response = self.generate_answer(questions[i], docs, source_pdf)
+                self.remember_answer(cache_key, questions[i], response, question_embeddings[i], docs, source_pdf,
+                                     None, retrieval_mode)
+                return response
+            except Exception as e:
+                logger.error(f"Error answering batch question {i}: {str(e)}")
+                return {"error": f"Error processing query: {str(e)}"}
+        
+        # Generation waits on the model, so a small thread pool overlaps the calls
+        with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as executor:
+            for i, response in zip(pending, executor.map(answer, pending, found)):
+                results[i] = response
+        return results
+
+    def query_embedder(self):
+        """Embeddings for questions: Gemini embeds them as search queries rather than documents"""
+        if isinstance(self.embeddings, GeminiEmbeddings):
+            return self.embeddings.for_queries()
+        return self.embeddings
+
+    def query_cache_model(self):
+        """Key of the question embeddings in the query embedding cache: the model and the task type"""
+        return f"{self.embedding_model}#query"
+
+    def embed_question(self, user_question):
+        """Embed a question, reusing the embedding of an earlier identical question"""
+        return self.embed_questions([user_question])[0]
+
+    async def aembed_question(self, user_question):
+        return (await self.aembed_questions([user_question]))[0]
+
+    def embed_questions(self, questions):
+        """Embed many questions, sending the ones not in the query embedding cache in one API call
+
+        Single questions take this path too, so a question gets the same
+        vector however it was first embedded.
+        """
+        model = self.query_cache_model()
+        embedded = [self.query_embeddings.get(model, question) for question in questions]
+        missing = [i for i, embedding in enumerate(embedded) if embedding is None]
+        if missing:
+            with stage("query_embedding"):
+                vectors = self.query_embedder().embed_documents([questions[i] for i in missing])
+            for i, vector in zip(missing, vectors):
+                self.query_embeddings.put(model, questions[i], vector)
+                embedded[i] = vector
+        return embedded
+
+    async def aembed_questions(self, questions):
+        model = self.query_cache_model()
+        embedded = [self.query_embeddings.get(model, question) for question in questions]
+        missing = [i for i, embedding in enumerate(embedded) if embedding is None]
+        if missing:
+            with stage("query_embedding"):
+                vectors = await self.query_embedder().aembed_documents([questions[i] for i in missing])
+            for i, vector in zip(missing, vectors):
+                self.query_embeddings.put(model, questions[i], vector)
+                embedded[i] = vector
+        return embedded
+
+    def stream_query(self, user_question, pdf_path=None, retrieval_mode=None, filters=None):
+        """Query the RAG system, yielding (event, data) pairs as the answer is generated"""
+        try:
+            index_key, cache_key, source_pdf = self.resolve_scope(pdf_path, filters, retrieval_mode)
+            if not index_key:
+                yield "error", self.scope_error(filters)
+                return
+            cached, docs, question_embedding = self.retrieve(index_key, user_question, retrieval_mode, filters,
+                                                             cache_key)
+            if cached is not None:
+                yield from cached_events(cached, source_pdf)
+                return
+            if filters is not None:
+                if not docs:
+                    yield "error", self.scope_error(filters, docs)
+                    return
+                source_pdf = docs[0].metadata.get("source_pdf")
+            
+            yield "metadata", retrieval_metadata(docs, source_pdf)
+            for event, data in self.stream_answer(user_question, docs, source_pdf):
+                if event == "done":
+                    self.remember_answer(cache_key, user_question, data, question_embedding, docs, source_pdf,
+                                         filters, retrieval_mode)
+                yield event, data
+            
+        except Exception as e:
+            logger.error(f"Error querying RAG system: {str(e)}")
+            yield "error", {"error": f"Error processing query: {str(e)}"}
+
+    async def astream_query(self, user_question, pdf_path=None, retrieval_mode=None, filters=None):
+        """stream_query() as an async generator"""
+        try:
+            index_key, cache_key, source_pdf = await asyncio.to_thread(self.resolve_scope, pdf_path, filters,
+                                                                       retrieval_mode)
+            if not index_key:
+                yield "error", self.scope_error(filters)
+                return
+            cached, docs, question_embedding = await self.aretrieve(index_key, user_question, retrieval_mode,
+                                                                    filters, cache_key)
+            if cached is not None:
+                for event, data in cached_events(cached, source_pdf):
+                    yield event, data
+                return
+            if filters is not None:
+                if not docs:
+                    yield "error", self.scope_error(filters, docs)
+                    return
+                source_pdf = docs[0].metadata.get("source_pdf")
+            
+            yield "metadata", retrieval_metadata(docs, source_pdf)
+            async for event, data in self.astream_answer(user_question, docs, source_pdf):
+                if event == "done":
+                    self.remember_answer(cache_key, user_question, data, question_embedding, docs, source_pdf,
+                                         filters, retrieval_mode)
+                yield event, data
             
-            # Try to get conversational chain response
+        except Exception as e:
+            logger.error(f"Error querying RAG system: {str(e)}")
+            yield "error", {"error": f"Error processing query: {str(e)}"}
+
+    def stream_answer(self, user_question, docs, source_pdf):
+        """Stream an answer token by token with the same fallbacks as generate_answer
+
+        The QA prompt is tried first and the direct prompt second. A fallback is
+        only possible until the first token has been sent to the client.
+        """
+        context = "\n\n".join([doc.page_content for doc in docs])
+        errors = []
+        for path, template, note in STREAM_ATTEMPTS:
+            parts = []
+            # Timed by hand: a context manager around yields would include the client's read time
+            started = time.perf_counter()
             try:
-                chain = self.get_conversational_chain()
+                model = self.llm_clients.get_chat_model(CHAT_MODEL, CHAT_TEMPERATURE)
+                prompt = template.format(context=context, question=user_question)
+                for chunk in model.stream(prompt):
+                    text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                    if text:
+                        if not parts:
+                            metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="first_token")
+                        parts.append(text)
+                        yield "token", {"text": text}
+            except Exception as e:
+                logger.error(f"Streaming error: {str(e)}")
+                if parts:
+                    QUERY_PATHS.inc(path="interrupted")
+                    yield "error", {"error": f"Generation interrupted: {str(e)}", "partial_answer": "".join(parts)}
+                    return
+                errors.append(e)
+                continue
+            
+            QUERY_PATHS.inc(path=path)
+            yield "done", streamed_response(parts, source_pdf, note)
+            return
+        
+        QUERY_PATHS.inc(path="failed")
+        yield "error", generation_failure(context, *errors)
+
+    async def astream_answer(self, user_question, docs, source_pdf):
+        """stream_answer() as an async generator over the model's async stream"""
+        context = "\n\n".join([doc.page_content for doc in docs])
+        errors = []
+        for path, template, note in STREAM_ATTEMPTS:
+            parts = []
+            started = time.perf_counter()
+            try:
+                model = self.llm_clients.get_chat_model(CHAT_MODEL, CHAT_TEMPERATURE)
+                prompt = template.format(context=context, question=user_question)
+                async for chunk in model.astream(prompt):
+                    text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                    if text:
+                        if not parts:
+                            metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="first_token")
+                        parts.append(text)
+                        yield "token", {"text": text}
+            except Exception as e:
+                logger.error(f"Streaming error: {str(e)}")
+                if parts:
+                    QUERY_PATHS.inc(path="interrupted")
+                    yield "error", {"error": f"Generation interrupted: {str(e)}", "partial_answer": "".join(parts)}
+                    return
+                errors.append(e)
+                continue
+            
+            QUERY_PATHS.inc(path=path)
+            yield "done", streamed_response(parts, source_pdf, note)
+            return
+        
+        QUERY_PATHS.inc(path="failed")
+        yield "error", generation_failure(context, *errors)
+
+    def generate_answer(self, user_question, docs, source_pdf):
+        """Answer a question from retrieved documents, falling back to a direct model call"""
+        # Try to get conversational chain response
+        try:
+            chain = self.get_conversational_chain()
+            with stage("generation_chain"):
                 response = chain(
                     {"input_documents": docs, "question": user_question},
                     return_only_outputs=True
                 )
+            
+            QUERY_PATHS.inc(path="chain")
+            return {
+                "answer": response["output_text"],
+                "source_pdf": source_pdf
+            }
+        except Exception as chain_error:
+            logger.error(f"Chain error: {str(chain_error)}")
+            
+            # Fallback: Use Google Gemini directly with context
+            try:
+                context = "\n\n".join([doc.page_content for doc in docs])
+                model = self.llm_clients.get_chat_model(CHAT_MODEL, CHAT_TEMPERATURE)
+                prompt = DIRECT_PROMPT_TEMPLATE.format(context=context, question=user_question)
                 
-                return {
-                    "answer": response["output_text"],
-                    "source_pdf": self.current_pdf
-                }
-            except Exception as chain_error:
-                logger.error(f"Chain error: {str(chain_error)}")
+                try:
+                    with stage("generation_direct"):
+                        direct_response = model.invoke(prompt)
+                    QUERY_PATHS.inc(path="direct")
+                    return direct_response_body(direct_response, source_pdf)
+                except Exception as direct_error:
+                    logger.error(f"Direct model error: {str(direct_error)}")
+                    QUERY_PATHS.inc(path="failed")
+                    
+                    # Final fallback: Return context with explanation
+                    return generation_failure(context, chain_error, direct_error)
+                    
+            except Exception as model_init_error:
+                logger.error(f"Model initialization error: {str(model_init_error)}")
+                QUERY_PATHS.inc(path="failed")
+                return model_init_failure(model_init_error)
+
+    async def agenerate_answer(self, user_question, docs, source_pdf):
+        """generate_answer() awaiting the model instead of blocking a thread on it"""
+        try:
+            chain = self.get_conversational_chain()
+            with stage("generation_chain"):
+                response = await chain.acall(
+                    {"input_documents": docs, "question": user_question},
+                    return_only_outputs=True
+                )
+            
+            QUERY_PATHS.inc(path="chain")
+            return {
+                "answer": response["output_text"],
+                "source_pdf": source_pdf
+            }
+        except Exception as chain_error:
+            logger.error(f"Chain error: {str(chain_error)}")
+            
+            try:
+                context = "\n\n".join([doc.page_content for doc in docs])
+                model = self.llm_clients.get_chat_model(CHAT_MODEL, CHAT_TEMPERATURE)
+                prompt = DIRECT_PROMPT_TEMPLATE.format(context=context, question=user_question)
                 
-                # Fallback: Use Google Gemini directly with context
                 try:
-                    context = "\n\n".join([doc.page_content for doc in docs])
-                    model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3)
+                    with stage("generation_direct"):
+                        direct_response = await model.ainvoke(prompt)
+                    QUERY_PATHS.inc(path="direct")
+                    return direct_response_body(direct_response, source_pdf)
+                except Exception as direct_error:
+                    logger.error(f"Direct model error: {str(direct_error)}")
+                    QUERY_PATHS.inc(path="failed")
+                    return generation_failure(context, chain_error, direct_error)
                     
-                    prompt = f"""Context from the document:
-{context}
+            except Exception as model_init_error:
+                logger.error(f"Model initialization error: {str(model_init_error)}")
+                QUERY_PATHS.inc(path="failed")
+                return model_init_failure(model_init_error)
 
-Question: {user_question}
+STREAM_ATTEMPTS = [
+    ("chain", QA_PROMPT_TEMPLATE, None),
+    ("direct", DIRECT_PROMPT_TEMPLATE, "Response generated using direct model call (fallback mode)"),
+]
 
-Based on the context provided above, please answer the question. If the context doesn't contain enough information to answer the question, please say so.
+def retrieval_metadata(docs, source_pdf):
+    """The metadata event sent before a streamed answer"""
+    return {
+        "source_pdf": source_pdf,
+        "sources": [{
+            "preview": doc.page_content[:200],
+            "page_start": doc.metadata.get("page_start"),
+            "page_end": doc.metadata.get("page_end"),
+            "source_pdf": doc.metadata.get("source_pdf", source_pdf)
+        } for doc in docs]
+    }
 
-Answer:"""
-                    
-                    try:
-                        direct_response = model.invoke(prompt)
-                        return {
-                            "answer": direct_response.content if hasattr(direct_response, 'content') else str(direct_response),
-                            "source_pdf": self.current_pdf,
-                            "note": "Response generated using direct model call (fallback mode)"
-                        }
-                    except Exception as direct_error:
-                        logger.error(f"Direct model error: {str(direct_error)}")
-                        
-                        # Final fallback: Return context with explanation
-                        if "not found" in str(direct_error).lower() or "404" in str(direct_error):
-                            return {
-                                "error": "Google Gemini API model not available. Please check your API key and model availability.",
-                                "details": f"Model error: {str(direct_error)}",
-                                "context_preview": context[:200] + "..." if len(context) > 200 else context
-                            }
-                        else:
-                            return {"error": f"All query methods failed. Chain error: {str(chain_error)}, Direct error: {str(direct_error)}"}
-                        
-                except Exception as model_init_error:
-                    logger.error(f"Model initialization error: {str(model_init_error)}")
-                    return {
-                        "error": "Failed to initialize Google Gemini model",
-                        "details": str(model_init_error),
-                        "suggestion": "Please check your GOOGLE_API_KEY and internet connection"
-                    }
-            
-        except Exception as e:
-            logger.error(f"Error querying RAG system: {str(e)}")
-            return {"error": f"Error processing query: {str(e)}"}
+def cached_events(cached, source_pdf):
+    """A cached answer as the events of a stream"""
+    yield "metadata", {"source_pdf": cached.get("source_pdf", source_pdf), "cache_hit": cached["cache_hit"]}
+    yield "token", {"text": cached.get("answer", "")}
+    yield "done", cached
+
+def streamed_response(parts, source_pdf, note=None):
+    response = {"answer": "".join(parts), "source_pdf": source_pdf}
+    if note:
+        response["note"] = note
+    return response
+
+def direct_response_body(direct_response, source_pdf):
+    return {
+        "answer": direct_response.content if hasattr(direct_response, 'content') else str(direct_response),
+        "source_pdf": source_pdf,
+        "note": "Response generated using direct model call (fallback mode)"
+    }
+
+def generation_failure(context, chain_error, direct_error):
+    """Error response once both the QA chain and the direct model call have failed"""
+    if "not found" in str(direct_error).lower() or "404" in str(direct_error):
+        return {
+            "error": "Google Gemini API model not available. Please check your API key and model availability.",
+            "details": f"Model error: {str(direct_error)}",
+            "context_preview": context[:200] + "..." if len(context) > 200 else context
+        }
+    return {"error": f"All query methods failed. Chain error: {str(chain_error)}, Direct error: {str(direct_error)}"}
+
+def model_init_failure(model_init_error):
+    return {
+        "error": "Failed to initialize Google Gemini model",
+        "details": str(model_init_error),
+        "suggestion": "Please check your GOOGLE_API_KEY and internet connection"
+    }
+
+def library_sources(docs):
+    """PDFs that retrieved library chunks came from, best ranked first"""
+    return list(dict.fromkeys(doc.metadata.get("source_pdf") for doc in docs if doc.metadata.get("source_pdf")))
 
 # Initialize RAG system
-rag_system = RAGSystem()
+pdf_catalog = PDFCatalog("static2")
+rag_system = RAGSystem(catalog=pdf_catalog)
+ingest_jobs = JobManager(max_workers=INGEST_WORKERS)
+model_discovery = ModelDiscovery()
+atexit.register(rag_system.query_embeddings.save)
+startup.mark("services")
+
+# Cache and ingest gauges are read from their owners when /metrics is scraped
+metrics.REGISTRY.gauge_callback(
+    "eduvision_vector_store_cache", "Vector store registry statistics",
+    rag_system.store_registry.stats, ["stat"])
+metrics.REGISTRY.gauge_callback(
+    "eduvision_answer_cache", "Answer cache statistics",
+    rag_system.answer_cache.stats, ["stat"])
+metrics.REGISTRY.gauge_callback(
+    "eduvision_query_embedding_cache", "Query embedding cache statistics",
+    rag_system.query_embeddings.stats, ["stat"])
+metrics.REGISTRY.gauge_callback(
+    "eduvision_ingest_jobs", "Known ingestion jobs by status", ingest_jobs.status_counts, ["status"])
+metrics.REGISTRY.gauge_callback(
+    "eduvision_startup_seconds", "Time spent in each startup phase", startup.report, ["phase"])
+
+@app.before_request
+def ensure_startup_hooks():
+    """Runs the startup hooks under WSGI servers, which import the app without running __main__"""
+    if not _startup_hooks_started:
+        run_startup_hooks()
+
+@app.before_request
+def start_request_metrics():
+    """Give each request a trace ID (or reuse the caller's X-Request-ID) and count it in flight"""
+    g.trace_token = trace_id_var.set(request.headers.get("X-Request-ID") or metrics.new_trace_id())
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+@app.after_request
+def add_trace_header(response):
+    response.headers["X-Trace-Id"] = trace_id_var.get()
+    if response.is_streamed:
+        # The body is sent after teardown; record once the server has closed it
+        record = request_metrics_recorder(response.status_code)
+        if record:
+            response.call_on_close(record)
+    else:
+        g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    """Records requests whose response was not streamed, or that failed before responding"""
+    record = request_metrics_recorder(g.get("response_status", 500))
+    if record:
+        record()
+
+def request_metrics_recorder(status):
+    """Take this request's metrics state from g, returning a function that records it, or None if taken"""
+    started = g.pop("request_started", None)
+    if started is None:
+        return None
+    endpoint, method, token = g.metrics_endpoint, request.method, g.pop("trace_token")
+    def record():
+        metrics.HTTP_IN_FLIGHT.dec(endpoint=endpoint)
+        metrics.HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=method, status=status)
+        try:
+            trace_id_var.reset(token)
+        except ValueError:
+            # Closed from another context, which never saw this request's trace ID
+            pass
+    return record
+
+def start_ingest_job(pdf_path, make_current=False):
+    """Index a PDF in the background and return the job tracking it
+
+    A load (make_current) gets its own job even while the PDF is being indexed
+    for another request; the build itself is still shared.
+    """
+    def run(job):
+        if make_current:
+            if not rag_system.load_and_process_pdf(pdf_path, job.update):
+                raise RuntimeError(f"Failed to load PDF: {pdf_path}")
+            return {"pdf_path": pdf_path, "index_key": rag_system.current_index}
+        index_key = rag_system.build_index(pdf_path, job.update)
+        if not index_key:
+            raise RuntimeError(f"Failed to index PDF: {pdf_path}")
+        return {"pdf_path": pdf_path, "index_key": index_key}
+    return ingest_jobs.submit((pdf_path, make_current), f"Index {os.path.basename(pdf_path)}", run)
+
+def start_library_job():
+    """Build the library-wide index in the background and return the job tracking it"""
+    def run(job):
+        index_key = rag_system.build_library(job.update)
+        if not index_key:
+            raise RuntimeError("Failed to build the library index")
+        return {"index_key": index_key}
+    return ingest_jobs.submit("library", "Index library", run)
+
+rag_system.on_library_stale = start_library_job
+
+def prewarm_library():
+    """Queue indexing of every PDF in the library so first requests find them ready"""
+    jobs = []
+    for file in pdf_catalog.filenames():
+        pdf_path = os.path.join(pdf_catalog.folder, file)
+        if not rag_system.is_indexed(pdf_path):
+            jobs.append(start_ingest_job(pdf_path))
+    # Queued after the books so it can reuse their vectors
+    index_key = rag_system.resolve_library()
+    if not index_key or not rag_system.library_is_current(index_key):
+        jobs.append(start_library_job())
+    logger.info(f"Prewarming {len(jobs)} indexes in the background")
+    return jobs
+
+_startup_hooks_started = False
+_startup_hooks_lock = threading.Lock()
+
+def prewarm_requested():
+    """The one switch for indexing at startup: PREWARM_PDFS=1 or --prewarm"""
+    return os.getenv("PREWARM_PDFS") == "1" or "--prewarm" in sys.argv
+
+def run_startup_hooks():
+    """Start the background startup work once per serving process, whichever server runs the app"""
+    global _startup_hooks_started
+    with _startup_hooks_lock:
+        if _startup_hooks_started:
+            return
+        _startup_hooks_started = True
+    # List the available models in the background so startup does not wait on the API
+    if os.getenv("GOOGLE_API_KEY"):
+        model_discovery.refresh_in_background()
+    # Load the tokenizer now so the first answer counts tokens exactly
+    rag_system.context_packer.load_encoding_in_background()
+    if prewarm_requested():
+        prewarm_library()
 
 def check_available_models():
-    """Check which Google Generative AI models are available"""
+    """Check whether the chat model is among the available Google Generative AI models"""
     try:
-        models = genai.list_models()
-        model_names = []
-        for model in models:
-            if 'generateContent' in model.supported_generation_methods:
-                model_names.append(model.name)
-        logger.info(f"Available Gemini models: {model_names}")
+        model_names = [model["name"] for model in model_discovery.models()]
         
         # Check if our desired model is available
-        desired_model = "models/gemini-2.0-flash"
+        desired_model = f"models/{CHAT_MODEL}"
         if desired_model in model_names:
-            logger.info(f"✅ Model {desired_model} is available")
             return True
         else:
             logger.warning(f"❌ Model {desired_model} not found. Available models: {model_names}")
@@ -239,46 +1413,20 @@ def find_available_port(preferred_ports):
 
 def find_pdf_by_criteria(branch, subject, semester, book=None, author=None):
     """Find PDF in static2 folder based on criteria"""
-    static_folder = "static2"
-    
-    if not os.path.exists(static_folder):
-        logger.error(f"Static folder {static_folder} not found")
+    if not pdf_catalog.exists:
+        logger.error(f"Static folder {pdf_catalog.folder} not found")
         return None
     
-    # Convert semester to Roman numeral format
-    semester_map = {
-        "1": "I", "2": "II", "3": "III", "4": "IV", "5": "V", 
-        "6": "VI", "7": "VII", "8": "VIII"
-    }
-    
-    roman_semester = semester_map.get(str(semester), str(semester))
-    
-    # List all PDF files
-    try:
-        pdf_files = [f for f in os.listdir(static_folder) if f.endswith('.pdf')]
-    except Exception as e:
-        logger.error(f"Error listing files in {static_folder}: {str(e)}")
-        return None
+    roman_semester = to_roman(semester)
     
     # Log the search criteria for debugging
     logger.info(f"Searching for PDFs: branch={branch}, subject={subject}, semester={roman_semester}")
     
-    # Filter by semester and subject
-    matching_files = []
-    for file in pdf_files:
-        if f"{roman_semester} SEM" in file and f"({subject.upper()})" in file:
-            matching_files.append(file)
-    
-    # If book and author are specified, try to find exact match
-    if book and author:
-        for file in matching_files:
-            if book.lower() in file.lower() and author.lower() in file.lower():
-                return os.path.join(static_folder, file)
-    
-    # Return first matching file if no exact match
-    if matching_files:
-        logger.info(f"Found matching PDF: {matching_files[0]}")
-        return os.path.join(static_folder, matching_files[0])
+    with stage("find_pdf"):
+        entry = pdf_catalog.find(semester, subject, book, author)
+    if entry:
+        logger.info(f"Found matching PDF: {entry['filename']}")
+        return entry["path"]
     
     logger.warning(f"No matching PDFs found for criteria: {roman_semester} SEM, ({subject.upper()})")
     return None
@@ -289,26 +1437,42 @@ def home():
 
 @app.route('/health')
 def health():
-    return jsonify({"status": "healthy", "current_pdf": rag_system.current_pdf})
+    return jsonify({
+        "status": "healthy",
+        "current_pdf": rag_system.current_pdf,
+        "library_index": rag_system.resolve_library(),
+        "vector_store_cache": rag_system.store_registry.stats(),
+        "answer_cache": rag_system.answer_cache.stats(),
+        "query_embedding_cache": rag_system.query_embeddings.stats(),
+        "embedding_model": rag_system.embedding_model,
+        "startup_seconds": startup.report()
+    })
 
 @app.route('/list-pdfs')
 def list_pdfs():
     """List all available PDFs"""
-    static_folder = "static2"
     try:
-        pdf_files = [f for f in os.listdir(static_folder) if f.endswith('.pdf')]
-        return jsonify({"pdfs": pdf_files})
+        return jsonify({"pdfs": pdf_catalog.filenames()})
     except Exception as e:
         return jsonify({"error": f"Error listing PDFs: {str(e)}"}), 500
 
-@app.route('/load-pdf', methods=['POST'])
-def load_pdf():
-    """Load a specific PDF for RAG"""
-    data = request.get_json()
-    
+@app.route('/catalog')
+def catalog():
+    """Structured catalog of available PDFs, optionally filtered by semester and subject"""
+    entries = pdf_catalog.entries(request.args.get('semester'), request.args.get('subject'))
+    return jsonify({
+        "books": [{k: v for k, v in entry.items() if k != "path"} for entry in entries],
+        "total_count": len(entries)
+    })
+
+def load_pdf_request(data):
+    """Find, and index or load, the PDF a /load-pdf request asks for; returns (body, status)"""
     if 'pdf_path' in data:
         # Direct PDF path
         pdf_path = data['pdf_path']
+        error = library_pdf_error(pdf_path)
+        if error:
+            return error
     else:
         # Find PDF by criteria
         branch = data.get('branch')
@@ -318,97 +1482,239 @@ def load_pdf():
         author = data.get('author')
         
         if not all([branch, subject, semester]):
-            return jsonify({"error": "Missing required parameters: branch, subject, semester"}), 400
+            return {"error": "Missing required parameters: branch, subject, semester"}, 400
         
         pdf_path = find_pdf_by_criteria(branch, subject, semester, book, author)
         
         if not pdf_path:
-            return jsonify({"error": "No matching PDF found for the given criteria"}), 404
+            return {"error": "No matching PDF found for the given criteria"}, 404
+    
+    # Index new PDFs in the background instead of holding the request open
+    if not os.path.exists(pdf_path):
+        return {"error": "PDF not found", "pdf_path": pdf_path}, 404
+    if not rag_system.is_indexed(pdf_path):
+        job = start_ingest_job(pdf_path, make_current=True)
+        return {
+            "message": "PDF is being processed",
+            "pdf_path": pdf_path,
+            "status": "processing",
+            "job_id": job.id
+        }, 202
     
     # Load the PDF
     success = rag_system.load_and_process_pdf(pdf_path)
     
     if success:
-        return jsonify({
+        return {
             "message": "PDF loaded successfully",
             "pdf_path": pdf_path,
             "status": "ready"
-        })
+        }, 200
     else:
-        return jsonify({"error": "Failed to load PDF"}), 500
+        return {"error": "Failed to load PDF"}, 500
+
+def library_pdf_error(pdf_path):
+    """The (body, status) to reply with when a client-supplied pdf_path is outside the library, else None
+
+    Paths are resolved (following symlinks and "..") and must name a PDF file
+    in the library folder, so clients cannot make the server read other files.
+    """
+    if pdf_path is None:
+        return None
+    if isinstance(pdf_path, str):
+        folder = os.path.realpath(pdf_catalog.folder)
+        path = os.path.realpath(pdf_path)
+        if (os.path.commonpath([folder, path]) == folder and path.lower().endswith(".pdf")
+                and (os.path.isfile(path) or not os.path.exists(path))):
+            return None
+    return {"error": f"pdf_path must be a PDF in the {pdf_catalog.folder} folder"}, 400
+
+def query_error(data):
+    """The (body, status) to reply with when a /query request is invalid, else None"""
+    if 'question' not in data:
+        return {"error": "Missing 'question' parameter"}, 400
+    error = library_pdf_error(data.get('pdf_path'))
+    if error:
+        return error
+    
+    retrieval_mode = data.get('retrieval_mode')
+    if retrieval_mode and retrieval_mode not in RETRIEVAL_MODES:
+        return {"error": f"Invalid retrieval_mode. Use one of: {', '.join(RETRIEVAL_MODES)}"}, 400
+    return None
+
+@app.route('/load-pdf', methods=['POST'])
+def load_pdf():
+    """Load a specific PDF for RAG"""
+    body, status = load_pdf_request(request.get_json())
+    return jsonify(body), status
 
 @app.route('/query', methods=['POST'])
 def query():
     """Query the RAG system"""
     data = request.get_json()
+    error = query_error(data)
+    if error:
+        return jsonify(error[0]), error[1]
     
-    if 'question' not in data:
-        return jsonify({"error": "Missing 'question' parameter"}), 400
+    response = rag_system.query(data['question'], data.get('pdf_path'), data.get('retrieval_mode'))
+    
+    return jsonify(response)
+
+@app.route('/query/batch', methods=['POST'])
+def query_batch():
+    """Answer a list of questions about one PDF, e.g. to build a question bank"""
+    data = request.get_json()
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) for q in questions):
+        return jsonify({"error": "'questions' must be a non-empty list of strings"}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"Too many questions: at most {BATCH_MAX_QUESTIONS} per batch"}), 400
+    
+    retrieval_mode = data.get('retrieval_mode')
+    if retrieval_mode and retrieval_mode not in RETRIEVAL_MODES:
+        return jsonify({"error": f"Invalid retrieval_mode. Use one of: {', '.join(RETRIEVAL_MODES)}"}), 400
+    error = library_pdf_error(data.get('pdf_path'))
+    if error:
+        return jsonify(error[0]), error[1]
+    
+    try:
+        responses = rag_system.query_batch(questions, data.get('pdf_path'), retrieval_mode)
+    except Exception as e:
+        logger.error(f"Unexpected error in batch query: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+    
+    results = [dict(response, question=question) for question, response in zip(questions, responses)]
+    return jsonify({
+        "results": results,
+        "count": len(results),
+        "errors": sum("error" in result for result in results)
+    })
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    """Stream (event, data) pairs to the client as server-sent events"""
+    trace_id = trace_id_var.get()
+    def generate():
+        # The body is produced after the view returns, so carry the request's trace ID along
+        with metrics.trace(trace_id):
+            for event, data in events:
+                yield sse_event(event, data)
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+def prepare_chat(data):
+    """Validate a chat request and decide what it is answered from
+
+    Returns (question, target, metadata, None) when the question can be
+    answered, where target holds the pdf_path or library filters to pass to
+    the RAG system, or (None, None, None, (body, status)) with the response to
+    send instead. The target is scoped to this request; shared state is not
+    changed.
+    """
+    # Required parameters
+    required_params = ['branch', 'subject', 'semester', 'question']
+    missing_params = [param for param in required_params if param not in data]
+    
+    if missing_params:
+        return None, None, None, ({"error": f"Missing required parameters: {', '.join(missing_params)}"}, 400)
+    
+    if data.get('retrieval_mode') and data['retrieval_mode'] not in RETRIEVAL_MODES:
+        return None, None, None, ({"error": f"Invalid retrieval_mode. Use one of: {', '.join(RETRIEVAL_MODES)}"}, 400)
     
+    scope = data.get('scope') or CHAT_SCOPE
+    if scope not in CHAT_SCOPES:
+        return None, None, None, ({"error": f"Invalid scope. Use one of: {', '.join(CHAT_SCOPES)}"}, 400)
+    
+    branch = data['branch']
+    subject = data['subject']
+    semester = data['semester']
     question = data['question']
-    response = rag_system.query(question)
+    book = data.get('book')
+    author = data.get('author')
     
-    return jsonify(response)
+    logger.info(f"Chat request: {subject} - {book} by {author}")
+    
+    # Find and load PDF
+    pdf_path = find_pdf_by_criteria(branch, subject, semester, book, author)
+    
+    if not pdf_path:
+        available_pdfs = pdf_catalog.filenames()
+        return None, None, None, ({
+            "error": "No matching PDF found",
+            "criteria": {
+                "branch": branch,
+                "subject": subject,
+                "semester": semester,
+                "book": book,
+                "author": author
+            },
+            "available_pdfs": available_pdfs[:5]  # Show first 5 for debugging
+        }, 404)
+    
+    metadata = {
+        "branch": branch,
+        "subject": subject,
+        "semester": semester,
+        "book": book,
+        "author": author,
+        "pdf_used": pdf_path
+    }
+    
+    # The library index answers from every matching book in one search. While an
+    # update is pending, it can still answer for the course, but maybe not for this book.
+    library_key = rag_system.resolve_library(start_update=True)
+    if library_key and (scope == "course" or rag_system.library_is_current(library_key)):
+        if scope == "course":
+            filters = clean_filters({"semester": semester, "subject": subject})
+            # Any book of the course may be used; the answer's sources list the ones that were
+            metadata.update(pdf_used=None, selected_pdf=pdf_path)
+        else:
+            filters = {"source_pdf": pdf_path}
+        metadata.update(scope=scope, library_index=True)
+        return question, {"filters": filters}, metadata, None
+    metadata.update(scope="book", library_index=False)
+    
+    # Books without an index are prepared in the background
+    if not rag_system.is_indexed(pdf_path):
+        job = start_ingest_job(pdf_path)
+        return None, None, None, ({
+            "message": "This book is being prepared. Please try again once processing completes.",
+            "status": "processing",
+            "job_id": job.id,
+            "metadata": metadata
+        }, 202)
+    
+    return question, {"pdf_path": pdf_path}, metadata, None
+
+@app.route('/query/stream', methods=['POST'])
+def query_stream():
+    """Query the RAG system, streaming the answer as server-sent events"""
+    data = request.get_json()
+    error = query_error(data)
+    if error:
+        return jsonify(error[0]), error[1]
+    return sse_response(rag_system.stream_query(data['question'], data.get('pdf_path'), data.get('retrieval_mode')))
 
 @app.route('/chat', methods=['POST'])
 def chat():
     """Complete endpoint for eduvision-app integration"""
     try:
         data = request.get_json()
-        
-        # Required parameters
-        required_params = ['branch', 'subject', 'semester', 'question']
-        missing_params = [param for param in required_params if param not in data]
-        
-        if missing_params:
-            return jsonify({"error": f"Missing required parameters: {', '.join(missing_params)}"}), 400
-        
-        branch = data['branch']
-        subject = data['subject']
-        semester = data['semester']
-        question = data['question']
-        book = data.get('book')
-        author = data.get('author')
-        
-        logger.info(f"Chat request: {subject} - {book} by {author}")
-        
-        # Find and load PDF
-        pdf_path = find_pdf_by_criteria(branch, subject, semester, book, author)
-        
-        if not pdf_path:
-            available_pdfs = [f for f in os.listdir("static2") if f.endswith('.pdf')]
-            return jsonify({
-                "error": "No matching PDF found",
-                "criteria": {
-                    "branch": branch,
-                    "subject": subject,
-                    "semester": semester,
-                    "book": book,
-                    "author": author
-                },
-                "available_pdfs": available_pdfs[:5]  # Show first 5 for debugging
-            }), 404
-        
-        # Load PDF if it's different from current one
-        if rag_system.current_pdf != pdf_path:
-            logger.info(f"Loading new PDF: {pdf_path}")
-            success = rag_system.load_and_process_pdf(pdf_path)
-            if not success:
-                return jsonify({"error": "Failed to load PDF. Check server logs for details."}), 500
+        question, target, metadata, error = prepare_chat(data)
+        if error:
+            return jsonify(error[0]), error[1]
         
         # Query the system
         logger.info(f"Querying: {question}")
-        response = rag_system.query(question)
+        response = rag_system.query(question, retrieval_mode=data.get('retrieval_mode'), **target)
         
         # Add metadata
-        response['metadata'] = {
-            "branch": branch,
-            "subject": subject,
-            "semester": semester,
-            "book": book,
-            "author": author,
-            "pdf_used": pdf_path
-        }
+        response['metadata'] = metadata
         
         return jsonify(response)
         
@@ -416,40 +1722,105 @@ def chat():
         logger.error(f"Unexpected error in chat endpoint: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming variant of /chat: metadata first, then answer tokens as they are generated"""
+    try:
+        data = request.get_json()
+        question, target, metadata, error = prepare_chat(data)
+        if error:
+            return jsonify(error[0]), error[1]
+        
+        logger.info(f"Streaming query: {question}")
+        
+        def events():
+            for event, payload in rag_system.stream_query(question, retrieval_mode=data.get('retrieval_mode'), **target):
+                if event in ("metadata", "done"):
+                    payload = dict(payload, metadata=metadata)
+                yield event, payload
+        
+        return sse_response(events())
+        
+    except Exception as e:
+        logger.error(f"Unexpected error in chat endpoint: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route('/library', methods=['GET'])
+def library_status():
+    """Whether the library-wide index is built for the current set of PDFs"""
+    index_key = rag_system.resolve_library()
+    meta = rag_system.index_store.read_metadata(index_key) if index_key else None
+    job = ingest_jobs.active_job("library")
+    return jsonify({
+        "ready": bool(index_key),
+        "current": bool(index_key) and rag_system.library_is_current(index_key),
+        "index_key": index_key,
+        "books": meta.get("books", []) if meta else [],
+        "chunk_count": meta.get("chunk_count") if meta else None,
+        "deleted_chunks": meta.get("deleted_chunks", 0) if meta else None,
+        "index_type": rag_system.library_spec.index_type,
+        "job_id": job.id if job else None
+    })
+
+@app.route('/library/build', methods=['POST'])
+def build_library():
+    """Start building the library-wide index over every PDF in the catalog"""
+    index_key = rag_system.resolve_library()
+    if index_key and rag_system.library_is_current(index_key):
+        return jsonify({"message": "Library index is ready", "index_key": index_key, "status": "ready"})
+    job = start_library_job()
+    return jsonify({
+        "message": "Library index is being built",
+        "status": "processing",
+        "job_id": job.id
+    }), 202
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latencies, answer paths, cache and ingest gauges in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """List recent ingestion jobs"""
+    return jsonify({"jobs": ingest_jobs.list()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status and progress of an ingestion job"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/test', methods=['GET'])
 def test():
     """Simple test endpoint"""
     return jsonify({
         "message": "Backend is working!",
         "google_api_configured": bool(os.getenv("GOOGLE_API_KEY")),
-        "static2_exists": os.path.exists("static2"),
-        "pdf_count": len([f for f in os.listdir("static2") if f.endswith('.pdf')]) if os.path.exists("static2") else 0,
+        "static2_exists": pdf_catalog.exists,
+        "pdf_count": len(pdf_catalog.filenames()),
         "model_available": check_available_models()
     })
 
 @app.route('/models', methods=['GET'])
 def list_available_models():
-    """List available Google Generative AI models"""
+    """List available Google Generative AI models (cached for MODEL_DISCOVERY_TTL seconds)"""
     try:
-        models = genai.list_models()
-        model_info = []
-        for model in models:
-            if 'generateContent' in model.supported_generation_methods:
-                model_info.append({
-                    "name": model.name,
-                    "display_name": model.display_name,
-                    "description": getattr(model, 'description', 'No description'),
-                    "supported_methods": model.supported_generation_methods
-                })
+        model_info = model_discovery.models()
         
         return jsonify({
             "available_models": model_info,
             "total_count": len(model_info),
-            "desired_model_available": "models/gemini-2.0-flash" in [m["name"] for m in model_info]
+            "desired_model_available": f"models/{CHAT_MODEL}" in [m["name"] for m in model_info]
         })
     except Exception as e:
         return jsonify({"error": f"Failed to list models: {str(e)}"}), 500
 
+startup.mark("routes")
+logger.info(f"Startup timings (seconds): {startup.report()}")
+
 if __name__ == '__main__':
     # Check if static2 folder exists
     if not os.path.exists('static2'):
@@ -462,16 +1833,12 @@ if __name__ == '__main__':
         logger.error("GOOGLE_API_KEY not found in environment variables!")
     else:
         logger.info("Google API key configured")
-        
-        # Check available models
-        logger.info("Checking available Gemini models...")
-        try:
-            if check_available_models():
-                logger.info("✅ Gemini 2.0 Flash model is available")
-            else:
-                logger.warning("❌ Gemini 2.0 Flash model not available - will try anyway")
-        except Exception as e:
-            logger.warning(f"Could not check models: {e} - will try anyway")
+    
+    # The debug reloader's watcher process serves nothing; only the process
+    # that serves requests runs the startup hooks
+    use_reloader = os.getenv("FLASK_RELOAD", "1") == "1"
+    if not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        run_startup_hooks()
     
     # Find an available port
     preferred_ports = [5001, 5002, 5003, 8000, 8001, 8080, 3001, 4000, 4001]
@@ -481,4 +1848,4 @@ if __name__ == '__main__':
     logger.info(f"📡 API will be available at: http://localhost:{port}")
     logger.info(f"💡 Update your frontend to use: http://localhost:{port}/chat")
     
-    app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=port, use_reloader=use_reloader)
\ No newline at end of file
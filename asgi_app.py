@@ -0,0 +1,210 @@
+"""Async serving mode: the same API on an ASGI server
+
+The question-answering routes run on the event loop, so a request waiting on
+Gemini holds no thread and one process can keep hundreds of chats open.
+Blocking work (catalog lookups, loading indexes, FAISS and BM25 searches)
+runs in threads, and ingestion stays on the background job pool. Every other
+route is served by the Flask app unchanged.
+
+    uvicorn asgi_app:asgi_app --host 0.0.0.0 --port 5001
+    python asgi_app.py
+"""
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import metrics
+from app import app as flask_app
+from app import (find_available_port, load_pdf_request, prepare_chat, query_error, rag_system, run_startup_hooks,
+                 sse_event)
+from metrics import trace_id_var
+
+logger = logging.getLogger(__name__)
+
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "10"))
+
+
+async def request_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def invalid_json():
+    return JSONResponse({"error": "Request body must be a JSON object"}, status_code=400)
+
+
+def sse_stream(events):
+    """Stream an async iterator of (event, data) pairs as server-sent events"""
+    async def generate():
+        async for event, data in events:
+            yield sse_event(event, data)
+    return StreamingResponse(generate(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+async def chat(request):
+    """Async /chat"""
+    try:
+        data = await request_json(request)
+        if data is None:
+            return invalid_json()
+        question, target, metadata, error = await run_in_threadpool(prepare_chat, data)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+
+        logger.info(f"Querying: {question}")
+        response = await rag_system.aquery(question, retrieval_mode=data.get('retrieval_mode'), **target)
+        response['metadata'] = metadata
+        return JSONResponse(response)
+
+    except Exception as e:
+        logger.error(f"Unexpected error in chat endpoint: {str(e)}")
+        return JSONResponse({"error": f"Server error: {str(e)}"}, status_code=500)
+
+
+async def chat_stream(request):
+    """Async /chat/stream"""
+    try:
+        data = await request_json(request)
+        if data is None:
+            return invalid_json()
+        question, target, metadata, error = await run_in_threadpool(prepare_chat, data)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+
+        logger.info(f"Streaming query: {question}")
+
+        async def events():
+            async for event, payload in rag_system.astream_query(question, retrieval_mode=data.get('retrieval_mode'),
+                                                                 **target):
+                if event in ("metadata", "done"):
+                    payload = dict(payload, metadata=metadata)
+                yield event, payload
+
+        return sse_stream(events())
+
+    except Exception as e:
+        logger.error(f"Unexpected error in chat endpoint: {str(e)}")
+        return JSONResponse({"error": f"Server error: {str(e)}"}, status_code=500)
+
+
+async def query(request):
+    """Async /query"""
+    data = await request_json(request)
+    if data is None:
+        return invalid_json()
+    error = query_error(data)
+    if error:
+        return JSONResponse(error[0], status_code=error[1])
+
+    response = await rag_system.aquery(data['question'], data.get('pdf_path'), data.get('retrieval_mode'))
+    return JSONResponse(response)
+
+
+async def query_stream(request):
+    """Async /query/stream"""
+    data = await request_json(request)
+    if data is None:
+        return invalid_json()
+    error = query_error(data)
+    if error:
+        return JSONResponse(error[0], status_code=error[1])
+    return sse_stream(rag_system.astream_query(data['question'], data.get('pdf_path'), data.get('retrieval_mode')))
+
+
+async def load_pdf(request):
+    """Async /load-pdf: new PDFs go to the ingestion jobs, indexed ones are loaded in a thread"""
+    data = await request_json(request)
+    if data is None:
+        return invalid_json()
+    body, status = await run_in_threadpool(load_pdf_request, data)
+    return JSONResponse(body, status_code=status)
+
+
+ASYNC_ROUTES = {
+    "/chat": chat,
+    "/chat/stream": chat_stream,
+    "/query": query,
+    "/query/stream": query_stream,
+    "/load-pdf": load_pdf,
+}
+
+
+class RequestMetrics:
+    """Trace IDs and request metrics for the async routes, as the Flask hooks do for the rest
+
+    Wrapping the whole ASGI call means streamed bodies are included in the
+    recorded duration.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in ASYNC_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = scope["path"]
+        headers = dict(scope["headers"])
+        trace_id = headers.get(b"x-request-id", b"").decode("latin-1") or metrics.new_trace_id()
+        status = 500
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-trace-id", trace_id.encode("latin-1"))]
+            await send(message)
+
+        token = trace_id_var.set(trace_id)
+        started = time.perf_counter()
+        metrics.HTTP_IN_FLIGHT.inc(endpoint=endpoint)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec(endpoint=endpoint)
+            metrics.HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint,
+                                         method=scope["method"], status=status)
+            trace_id_var.reset(token)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    run_startup_hooks()
+    yield
+
+
+def create_app():
+    routes = [Route(path, endpoint, methods=["POST"]) for path, endpoint in ASYNC_ROUTES.items()]
+    routes.append(Mount("/", app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)))
+    return Starlette(routes=routes, lifespan=lifespan, middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(RequestMetrics),
+    ])
+
+
+asgi_app = create_app()
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.getenv("PORT", "0")) or find_available_port([5001, 5002, 5003, 8000, 8001, 8080, 3001, 4000, 4001])
+    logger.info(f"🚀 Starting async server on port {port}")
+    uvicorn.run(asgi_app, host='0.0.0.0', port=port)
@@ -0,0 +1,203 @@
+"""Offline benchmark of the RAG pipeline, stage by stage
+
+Generates synthetic PDFs, swaps the Gemini embeddings and chat model for
+deterministic local stand-ins and times each RAGSystem stage. Results are
+printed (or written with --output) as JSON, so runs can be compared between
+releases.
+
+    python benchmark.py --pages 200 --queries 100 --output bench.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+VOCABULARY = """
+algorithm array binary buffer cache compiler concurrency deadlock disk distributed encryption file graph hash heap
+instruction interrupt kernel latency memory network node page paging pipeline pointer process processor protocol
+queue recursion register scheduler search semaphore sorting stack storage thread throughput transaction tree
+virtual address bus clock cycle cpu database index inference knowledge learning logic model neural optimization
+planning probability query reasoning relation schema software testing requirement design module coupling cohesion
+""".split()
+
+
+def synthetic_pages(pages, words_per_page, seed=0):
+    """Deterministic pages of vocabulary text with a chapter heading every ten pages"""
+    rng = random.Random(seed)
+    result = []
+    for page in range(pages):
+        lines = []
+        if page % 10 == 0:
+            lines.append(f"CHAPTER {page // 10 + 1}")
+        words = [rng.choice(VOCABULARY) for _ in range(words_per_page)]
+        lines.extend(" ".join(words[i:i + 12]) for i in range(0, len(words), 12))
+        result.append(lines)
+    return result
+
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one Helvetica text stream per page"""
+    def escape(text):
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = "BT /F1 9 Tf 30 800 Td 11 TL " + " ".join(f"({escape(line)}) '" for line in lines) + " ET"
+        kids.append(f"{len(objects) + 1} 0 R")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects) + 2} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>"
+
+    out, offsets = "%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    with open(path, "w", encoding="latin-1") as f:
+        f.write(out)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def latency_summary(seconds):
+    millis = np.asarray(seconds) * 1000
+    return {
+        "count": len(millis),
+        "mean_ms": round(float(millis.mean()), 3),
+        "p50_ms": round(float(np.percentile(millis, 50)), 3),
+        "p95_ms": round(float(np.percentile(millis, 95)), 3),
+        "p99_ms": round(float(np.percentile(millis, 99)), 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def make_questions(count, seed=1):
+    rng = random.Random(seed)
+    return [f"What is the role of {rng.choice(VOCABULARY)} in {rng.choice(VOCABULARY)} {n}?" for n in range(count)]
+
+
+def run(args, workdir):
+    # app reads its configuration from the environment at import time
+    os.environ["INDEX_CACHE_DIR"] = os.path.join(workdir, "indexes")
+    os.environ["ANSWER_CACHE_SIMILARITY"] = "1.0"
+    os.environ["VECTOR_INDEX_TYPE"] = args.index_type
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    import app
+    from offline import StubChatModel, StubEmbeddings
+
+    rag = app.rag_system
+    rag.embeddings = StubEmbeddings(args.embedding_size, args.embed_latency_ms / 1000)
+    rag.embedding_pipeline.embeddings = rag.embeddings
+    rag.llm_clients.set_chat_model(app.CHAT_MODEL, app.CHAT_TEMPERATURE,
+                                   StubChatModel(latency=args.llm_latency_ms / 1000))
+
+    stages = {name: [] for name in ("get_pdf_text", "text_store_read", "get_page_chunks", "create_vector_store")}
+    index_keys, totals = [], {"pages": 0, "chunks": 0}
+    for number in range(args.pdfs):
+        pdf_path = os.path.join(workdir, f"synthetic-{number}.pdf")
+        write_pdf(pdf_path, synthetic_pages(args.pages, args.words_per_page, seed=number))
+
+        _, seconds = timed(rag.get_pdf_text, pdf_path)
+        stages["get_pdf_text"].append({"seconds": seconds, "pages": args.pages})
+        # Parsed once above; later builds read the pages back from the text store
+        pages, seconds = timed(rag.get_pdf_page_list, pdf_path)
+        stages["text_store_read"].append({"seconds": seconds, "pages": args.pages})
+        (chunks, metadatas), seconds = timed(rag.get_page_chunks, pages, rag.chunking_for(pdf_path))
+        stages["get_page_chunks"].append({"seconds": seconds, "chunks": len(chunks)})
+
+        # Same key build_index would use, so query() finds the index by PDF path
+        index_key = rag.index_store.index_key(pdf_path, rag.index_params(pdf_path))
+        ok, seconds = timed(rag.create_vector_store, chunks, index_key, {"source_pdf": pdf_path},
+                            chunk_metadatas=metadatas)
+        if not ok:
+            raise RuntimeError(f"create_vector_store failed for {pdf_path}")
+        stages["create_vector_store"].append({"seconds": seconds, "chunks": len(chunks)})
+        index_keys.append((index_key, pdf_path))
+        totals["pages"] += args.pages
+        totals["chunks"] += len(chunks)
+
+    results = {}
+    for name, runs in stages.items():
+        seconds = sum(r["seconds"] for r in runs)
+        unit = "pages" if name in ("get_pdf_text", "text_store_read") else "chunks"
+        count = sum(r[unit] for r in runs)
+        results[name] = {"seconds": round(seconds, 4), unit: count,
+                         f"{unit}_per_second": round(count / seconds, 1) if seconds else None}
+    results["peak_rss_mb_after_ingest"] = peak_rss_mb()
+
+    # Retrieval and full queries against the indexed PDFs, with fresh questions so nothing is cached
+    questions = make_questions(args.queries)
+    retrieval = []
+    for n, question in enumerate(questions):
+        index_key, _ = index_keys[n % len(index_keys)]
+        _, seconds = timed(rag.retrieve, index_key, question, args.retrieval_mode)
+        retrieval.append(seconds)
+    results["retrieve"] = latency_summary(retrieval)
+
+    queries, errors = [], 0
+    for n, question in enumerate(make_questions(args.queries, seed=2)):
+        _, pdf_path = index_keys[n % len(index_keys)]
+        response, seconds = timed(rag.query, question, pdf_path, args.retrieval_mode)
+        errors += "error" in response
+        queries.append(seconds)
+    results["query"] = dict(latency_summary(queries), errors=errors)
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "totals": totals,
+        "stages": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdfs", type=int, default=2, help="number of synthetic PDFs")
+    parser.add_argument("--pages", type=int, default=100, help="pages per PDF")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--embedding-size", type=int, default=768)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated latency per embeddings call")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated latency per chat model call")
+    parser.add_argument("--retrieval-mode", default="hybrid", choices=("hybrid", "vector", "lexical"))
+    parser.add_argument("--index-type", default="flat", choices=("flat", "hnsw", "ivf", "ivfpq"))
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="eduvision-bench-")
+    try:
+        report = run(args, workdir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
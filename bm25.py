@@ -0,0 +1,129 @@
+import json
+import logging
+import re
+from collections import Counter
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[+#]+|(?:[._-][a-z0-9]+)*)")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were what which
+who whom why how when where will with does do did can could should would i you we they he she them our your
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens, keeping technical terms such as c++, tcp/ip parts and 8051"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of chunk positions
+
+    Document i in this index is chunk i of the FAISS store it was built with,
+    so lexical and vector hits can be merged by position.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> (doc positions, term frequencies)
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.avg_doc_length = 0.0
+
+    @property
+    def doc_count(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts, k1=1.5, b=0.75):
+        index = cls(k1, b)
+        postings = {}
+        lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(position)
+                postings[term][1].append(tf)
+        index.postings = {
+            term: (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (ids, tfs) in postings.items()
+        }
+        index.doc_lengths = np.asarray(lengths, dtype=np.float32)
+        index.avg_doc_length = float(index.doc_lengths.mean()) if lengths else 0.0
+        return index
+
+    def extend(self, texts):
+        """Append documents at the next positions, matching vectors added to the FAISS store"""
+        added = BM25Index.build(texts, self.k1, self.b)
+        offset = np.int32(self.doc_count)
+        for term, (ids, tfs) in added.postings.items():
+            existing = self.postings.get(term)
+            if existing is None:
+                self.postings[term] = (ids + offset, tfs)
+            else:
+                self.postings[term] = (np.concatenate([existing[0], ids + offset]), np.concatenate([existing[1], tfs]))
+        self.doc_lengths = np.concatenate([self.doc_lengths, added.doc_lengths])
+        self.avg_doc_length = float(self.doc_lengths.mean()) if self.doc_count else 0.0
+
+    def search(self, query, k=10, positions=None):
+        """Return up to k (position, score) pairs, best first, optionally only among positions"""
+        if not self.doc_count or (positions is not None and not len(positions)):
+            return []
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            idf = np.log(1 + (self.doc_count - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm[ids])
+        if positions is not None:
+            allowed = np.zeros(self.doc_count, dtype=bool)
+            allowed[positions] = True
+            scores[~allowed] = 0
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        top = hits[np.argsort(-scores[hits], kind="stable")[:k]]
+        return [(int(position), float(scores[position])) for position in top]
+
+    def nbytes(self):
+        return int(self.doc_lengths.nbytes + sum(ids.nbytes + tfs.nbytes for ids, tfs in self.postings.values()))
+
+    def save(self, path):
+        """Save as one .npz: a vocabulary plus concatenated postings with offsets"""
+        terms = sorted(self.postings)
+        ids = [self.postings[t][0] for t in terms]
+        tfs = [self.postings[t][1] for t in terms]
+        offsets = np.cumsum([0] + [len(a) for a in ids]).astype(np.int64)
+        np.savez_compressed(
+            path,
+            terms=np.asarray(json.dumps(terms)),
+            offsets=offsets,
+            ids=np.concatenate(ids) if ids else np.zeros(0, dtype=np.int32),
+            tfs=np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.float32),
+            doc_lengths=self.doc_lengths,
+            params=np.asarray([self.k1, self.b], dtype=np.float64),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            k1, b = data["params"].tolist()
+            index = cls(k1, b)
+            terms = json.loads(str(data["terms"]))
+            offsets, ids, tfs = data["offsets"], data["ids"], data["tfs"]
+            index.postings = {
+                term: (ids[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]])
+                for i, term in enumerate(terms)
+            }
+            index.doc_lengths = data["doc_lengths"]
+        index.avg_doc_length = float(index.doc_lengths.mean()) if index.doc_count else 0.0
+        return index
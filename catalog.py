@@ -0,0 +1,137 @@
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# "IV SEM- (COMP) 'Computer Fundamentals- Architecture and Organization' by B. Ram.pdf"
+FILENAME_PATTERN = re.compile(
+    r"^\s*(?P<semester>[IVX]+)\s+SEM-?\s*\((?P<subject>[^)]+)\)\s*'(?P<title>.+)'\s+by\s+(?P<author>.+?)\s*\.pdf$",
+    re.IGNORECASE,
+)
+
+SEMESTER_MAP = {
+    "1": "I", "2": "II", "3": "III", "4": "IV", "5": "V",
+    "6": "VI", "7": "VII", "8": "VIII"
+}
+
+
+def to_roman(semester):
+    """Convert a semester number to the Roman numeral used in filenames"""
+    return SEMESTER_MAP.get(str(semester), str(semester).upper())
+
+
+def normalize(value):
+    return " ".join(str(value).lower().split())
+
+
+def parse_pdf_filename(filename):
+    """Parse a library filename into semester, subject, title and author"""
+    match = FILENAME_PATTERN.match(filename)
+    if not match:
+        return None
+    return {
+        "semester": match.group("semester").upper(),
+        "subject": match.group("subject").strip().upper(),
+        "title": match.group("title").strip(),
+        "author": match.group("author").strip(),
+    }
+
+
+class PDFCatalog:
+    """Structured index of the PDFs in the library folder
+
+    Filenames are parsed once into semester, subject, title and author and
+    indexed for direct lookup. The index is rebuilt only when the folder's
+    mtime changes, i.e. when files are added, removed or renamed.
+    """
+
+    def __init__(self, folder="static2"):
+        self.folder = folder
+        self._mtime = None
+        self._entries = []
+        self._unparsed = []
+        self._by_course = {}
+        self._by_book = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Rebuild the index if the folder changed since the last build"""
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            mtime = None
+        if not force and mtime == self._mtime:
+            return
+        with self._lock:
+            if not force and mtime == self._mtime:
+                return
+            self._build(mtime)
+
+    def _build(self, mtime):
+        entries, unparsed, by_course, by_book = [], [], {}, {}
+        if mtime is not None:
+            for filename in sorted(os.listdir(self.folder)):
+                if not filename.endswith('.pdf'):
+                    continue
+                fields = parse_pdf_filename(filename)
+                if fields is None:
+                    unparsed.append(filename)
+                    continue
+                entry = dict(fields, filename=filename, path=os.path.join(self.folder, filename))
+                entries.append(entry)
+                by_course.setdefault((entry["semester"], entry["subject"]), []).append(entry)
+                book_key = (entry["semester"], entry["subject"], normalize(entry["title"]), normalize(entry["author"]))
+                by_book.setdefault(book_key, entry)
+        if unparsed:
+            logger.warning(f"{len(unparsed)} PDFs in {self.folder} do not follow the naming format")
+        self._entries, self._unparsed = entries, unparsed
+        self._by_course, self._by_book = by_course, by_book
+        self._mtime = mtime
+        logger.info(f"Catalog built: {len(entries)} PDFs in {self.folder}")
+
+    @property
+    def exists(self):
+        self.refresh()
+        return self._mtime is not None
+
+    def filenames(self):
+        self.refresh()
+        return [entry["filename"] for entry in self._entries] + list(self._unparsed)
+
+    def entries(self, semester=None, subject=None):
+        """Catalog entries, optionally filtered by semester and subject"""
+        self.refresh()
+        if semester and subject:
+            return list(self._by_course.get((to_roman(semester), subject.upper()), []))
+        return [entry for entry in self._entries
+                if (not semester or entry["semester"] == to_roman(semester))
+                and (not subject or entry["subject"] == subject.upper())]
+
+    def find(self, semester, subject, book=None, author=None):
+        """Return the best catalog entry for the criteria, or None"""
+        self.refresh()
+        roman = to_roman(semester)
+        subject = subject.upper()
+
+        if book and author:
+            entry = self._by_book.get((roman, subject, normalize(book), normalize(author)))
+            if entry:
+                return entry
+
+        candidates = self._by_course.get((roman, subject), [])
+        if book and author:
+            # Partial titles or author names still pick the right book within the course
+            for entry in candidates:
+                if normalize(book) in normalize(entry["title"]) and normalize(author) in normalize(entry["author"]):
+                    return entry
+        if candidates:
+            return candidates[0]
+
+        # Files outside the naming format fall back to substring matching
+        for filename in self._unparsed:
+            if f"{roman} SEM" in filename and f"({subject})" in filename:
+                return {"filename": filename, "path": os.path.join(self.folder, filename),
+                        "semester": roman, "subject": subject, "title": None, "author": None}
+        return None
@@ -0,0 +1,287 @@
+import bisect
+import fnmatch
+import json
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+BOUNDARIES = ("none", "page", "heading")
+
+# Lines such as "CHAPTER 3", "Unit IV", "2.3 Memory Hierarchy"
+HEADING_PATTERN = re.compile(
+    r"^(?:(?i:chapter|unit|part|section)\s+[\w.]+|\d+(?:\.\d+)*\.?\s+[A-Z][^\n]{2,80})\s*$",
+    re.MULTILINE,
+)
+
+
+class ChunkingConfig:
+    """How a document is split into chunks
+
+    boundary is "none" (split the whole text), "page" (chunks never cross a
+    page) or "heading" (chunks never cross a detected section heading).
+    """
+
+    def __init__(self, chunk_size=2000, chunk_overlap=200, boundary="none"):
+        if boundary not in BOUNDARIES:
+            raise ValueError(f"Unknown chunk boundary {boundary!r}, expected one of {BOUNDARIES}")
+        self.chunk_size = int(chunk_size)
+        self.chunk_overlap = int(chunk_overlap)
+        self.boundary = boundary
+
+    def to_dict(self):
+        return {"chunk_size": self.chunk_size, "chunk_overlap": self.chunk_overlap, "chunk_boundary": self.boundary}
+
+    def splitter(self):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        return RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+
+
+def load_overrides(path):
+    """Read per-document overrides: {"<filename or glob>": {"chunk_size": ..., "index_type": ...}}"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read per-document overrides {path}: {str(e)}")
+        return {}
+
+
+CHUNKING_KEYS = ("chunk_size", "chunk_overlap", "chunk_boundary", "boundary")
+
+
+def override_for(pdf_path, overrides):
+    """The first override whose pattern matches the PDF's filename, or an empty dict"""
+    filename = os.path.basename(pdf_path)
+    for pattern, values in overrides.items():
+        if filename == pattern or fnmatch.fnmatch(filename, pattern):
+            return values
+    return {}
+
+
+def config_for(pdf_path, default, overrides):
+    """Chunking config for one PDF, applying the first override whose pattern matches its filename"""
+    values = {k: v for k, v in override_for(pdf_path, overrides).items() if k in CHUNKING_KEYS}
+    if not values:
+        return default
+    merged = dict(chunk_size=default.chunk_size, chunk_overlap=default.chunk_overlap, boundary=default.boundary)
+    merged.update({("boundary" if k == "chunk_boundary" else k): v for k, v in values.items()})
+    return ChunkingConfig(**merged)
+
+
+def _page_range(page_starts, page_numbers, start, end):
+    first = page_numbers[max(0, bisect.bisect_right(page_starts, start) - 1)]
+    last = page_numbers[max(0, bisect.bisect_right(page_starts, max(start, end - 1)) - 1)]
+    return first, last
+
+
+def _split_with_offsets(splitter, text):
+    """Split text and return (chunk, start_offset) pairs"""
+    results = []
+    search_from = 0
+    for chunk in splitter.split_text(text):
+        start = text.find(chunk, search_from)
+        if start < 0:
+            start = search_from
+        results.append((chunk, start))
+        search_from = start + 1
+    return results
+
+
+def _sections(text):
+    """Split text at heading lines, returning (section_text, offset) pairs"""
+    starts = [0] + [m.start() for m in HEADING_PATTERN.finditer(text) if m.start() > 0]
+    ends = starts[1:] + [len(text)]
+    return [(text[s:e], s) for s, e in zip(starts, ends) if text[s:e].strip()]
+
+
+def _open_section(text):
+    """(offset of the last heading that is followed by more text, whether text may end in a heading)
+
+    A heading at the very end of the text may still be cut short, so it is
+    only trusted once more text follows it.
+    """
+    start, pending = 0, False
+    for match in HEADING_PATTERN.finditer(text):
+        if match.start() == 0:
+            continue
+        if match.end() < len(text):
+            start = match.start()
+        else:
+            pending = True
+    return start, pending
+
+
+def iter_chunks(pages, config):
+    """Yield (chunk, metadata) for (page_number, text) pages, reading the pages as it goes
+
+    Each metadata holds page_start, page_end and the chunk's character offset
+    in the document. Between pages only the text of the chunk still being
+    filled (and of the section, for heading boundaries) is kept, never the
+    whole document.
+    """
+    splitter = config.splitter()
+
+    if config.boundary == "page":
+        offset = 0
+        for page_number, text in pages:
+            for chunk, start in _split_with_offsets(splitter, text):
+                yield chunk, {"page_start": page_number, "page_end": page_number, "start_index": offset + start}
+            offset += len(text)
+        return
+
+    page_starts, page_numbers = [], []
+
+    def split(text, text_start, keep_last):
+        # Returns where the chunk kept back starts, so its text can be split again with the next page
+        chunks = _split_with_offsets(splitter, text)
+        kept = len(text)
+        if keep_last and chunks:
+            kept = chunks.pop()[1]
+        for chunk, start in chunks:
+            start += text_start
+            page_start, page_end = _page_range(page_starts, page_numbers, start, start + len(chunk))
+            yield chunk, {"page_start": page_start, "page_end": page_end, "start_index": start}
+        return kept
+
+    headings = config.boundary == "heading"
+    buffer, buffer_start, offset = "", 0, 0
+    for page_number, text in pages:
+        page_starts.append(offset)
+        page_numbers.append(page_number)
+        offset += len(text)
+        buffer += text
+        pending = False
+        if headings:
+            cut, pending = _open_section(buffer)
+            if cut:
+                for section, section_start in _sections(buffer[:cut]):
+                    yield from split(section, buffer_start + section_start, keep_last=False)
+                buffer, buffer_start = buffer[cut:], buffer_start + cut
+        if len(buffer) > config.chunk_size and not pending:
+            kept = yield from split(buffer, buffer_start, keep_last=True)
+            buffer, buffer_start = buffer[kept:], buffer_start + kept
+
+    for section, section_start in (_sections(buffer) if headings else [(buffer, 0)]):
+        yield from split(section, buffer_start + section_start, keep_last=False)
+
+
+def chunk_pages(pages, config):
+    """Split (page_number, text) pages into chunk texts and metadata with page ranges
+
+    Returns (texts, metadatas); see iter_chunks.
+    """
+    texts, metadatas = [], []
+    for chunk, metadata in iter_chunks(pages, config):
+        texts.append(chunk)
+        metadatas.append(metadata)
+    return texts, metadatas
+
+
+def _span(doc):
+    start = doc.metadata.get("start_index")
+    if start is None:
+        return None
+    return doc.metadata.get("source_pdf"), start, start + len(doc.page_content)
+
+
+def _merge(first, second):
+    """One document covering the overlapping spans of two chunks of the same document"""
+    if second.metadata["start_index"] < first.metadata["start_index"]:
+        first, second = second, first
+    _, start, end = _span(first)
+    _, second_start, second_end = _span(second)
+    text = first.page_content + second.page_content[end - second_start:] if second_end > end else first.page_content
+    metadata = dict(first.metadata, start_index=start)
+    if "page_start" in first.metadata and "page_start" in second.metadata:
+        metadata["page_start"] = min(first.metadata["page_start"], second.metadata["page_start"])
+        metadata["page_end"] = max(first.metadata["page_end"], second.metadata["page_end"])
+    return type(first)(page_content=text, metadata=metadata)
+
+
+def collapse_overlaps(docs_and_scores):
+    """Merge retrieved chunks whose spans of the same document overlap
+
+    Neighbouring chunks share chunk_overlap characters, so retrieving both
+    would put that text in the prompt twice. Takes (doc, score) pairs, best
+    first; a merged chunk takes the place and best score of its first part.
+    Chunks without a start_index are kept as they are.
+    """
+    collapsed = []
+    for doc, score in docs_and_scores:
+        span = _span(doc)
+        place = len(collapsed)
+        i = 0
+        while span is not None and i < len(collapsed):
+            other, other_score = collapsed[i]
+            other_span = _span(other)
+            if other_span and other_span[0] == span[0] and span[1] < other_span[2] and other_span[1] < span[2]:
+                doc, score = _merge(other, doc), max(score, other_score)
+                span = _span(doc)
+                del collapsed[i]
+                place = min(place, i)
+                i = 0
+                continue
+            i += 1
+        collapsed.insert(place, (doc, score))
+    return collapsed
+
+
+class ContextPacker:
+    """Fills a token budget with the best-scoring retrieved chunks"""
+
+    def __init__(self, token_budget=3000, encoding_name="cl100k_base"):
+        self.token_budget = token_budget
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loading = False
+        self._lock = threading.Lock()
+
+    def load_encoding(self):
+        """Load the tiktoken encoding; tiktoken fetches its vocabulary on first use"""
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, estimating tokens from length: {str(e)}")
+
+    def load_encoding_in_background(self):
+        """Start loading the encoding unless it is already loading or loaded"""
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self.load_encoding, name="tiktoken-load", daemon=True).start()
+
+    def count_tokens(self, text):
+        # Requests never wait on the download: estimate until the encoding is ready
+        encoding = self._encoding
+        if encoding is None:
+            self.load_encoding_in_background()
+            return len(text) // 4 + 1
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def pack(self, docs_and_scores, higher_is_better=False, ranked=False):
+        """Return the documents that fit in the budget, best first
+
+        Chunks too large for the remaining budget are skipped so that smaller,
+        lower-ranked chunks can still fill it. The best chunk is always kept.
+        With ranked, docs_and_scores is already best first (e.g. in MMR order)
+        and is not sorted by score.
+        """
+        if not ranked:
+            docs_and_scores = sorted(docs_and_scores, key=lambda pair: pair[1], reverse=higher_is_better)
+        packed, used = [], 0
+        for doc, _ in docs_and_scores:
+            tokens = self.count_tokens(doc.page_content)
+            if packed and used + tokens > self.token_budget:
+                continue
+            packed.append(doc)
+            used += tokens
+            if used >= self.token_budget:
+                break
+        return packed
@@ -0,0 +1,19 @@
+"""Shared pytest fixtures"""
+import pytest
+
+import app
+from catalog import PDFCatalog
+from index_store import IndexStore
+from text_store import PageTextStore
+
+
+@pytest.fixture
+def rag(tmp_path):
+    """A RAGSystem with the local embedding backend, its library folder and caches under tmp_path"""
+    folder = tmp_path / "static2"
+    folder.mkdir()
+    system = app.RAGSystem(catalog=PDFCatalog(str(folder)), embedding_backend="local")
+    system.index_store = IndexStore(str(tmp_path / "indexes"))
+    system.text_store = PageTextStore(str(tmp_path / "text"))
+    system.embedding_pipeline.checkpoint_dir = str(tmp_path / "checkpoints")
+    return system
@@ -124,6 +124,7 @@ export default function ChatPage() {
   const [inputMessage, setInputMessage] = useState("")
   const [selectedBook, setSelectedBook] = useState<BookInfo | null>(null)
   const [isLoading, setIsLoading] = useState(false)
+  const [isStreaming, setIsStreaming] = useState(false)
   const [userSelections, setUserSelections] = useState({
     branch: "",
     semester: "",
@@ -270,6 +271,94 @@ export default function ChatPage() {
     return subjectCodes[subjectId] || subjectId.toUpperCase()
   }
 
+  const waitForJob = async (backendUrl: string, jobId: string) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 2000))
+      const response = await fetch(`${backendUrl}/jobs/${jobId}`)
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+      const job = await response.json()
+      if (job.status === "completed" || job.status === "failed") {
+        return job
+      }
+    }
+  }
+
+  // "static2/V SEM- (OS) 'Modern Operating Systems' by Andrew Tanenbaum.pdf" -> "Modern Operating Systems by Andrew Tanenbaum"
+  const sourceTitle = (path: string) => {
+    const name = path.split("/").pop()!.replace(/\.pdf$/i, "")
+    return name.replace(/^.*?\)\s*/, "").replace(/'/g, "").trim() || name
+  }
+
+  const formatAssistantResponse = (data: any) => {
+    if (data.error) {
+      return `❌ **Error:** ${data.error}\n\nPlease try:\n• Selecting a different book\n• Rephrasing your question\n• Checking if the backend is running`
+    }
+    let assistantResponse = data.answer || "I couldn't generate a response. Please try again."
+
+    // Name the books the answer actually came from (course-wide answers may use several)
+    const sources: string[] = data.sources?.length ? data.sources : data.source_pdf ? [data.source_pdf] : []
+    if (sources.length) {
+      assistantResponse += `\n\n📖 **${sources.length > 1 ? "Sources" : "Source"}:** ${sources.map(sourceTitle).join("; ")}`
+    }
+    return assistantResponse
+  }
+
+  const addAssistantMessage = (content: string) => {
+    const id = (Date.now() + 1).toString()
+    setMessages((prev) => [...prev, { id, type: "assistant", content, timestamp: new Date() }])
+    return id
+  }
+
+  const readChatStream = async (response: Response) => {
+    let assistantId: string | null = null
+    let answer = ""
+    const show = (content: string) => {
+      if (assistantId === null) {
+        setIsStreaming(true)
+        assistantId = addAssistantMessage(content)
+      } else {
+        const id = assistantId
+        setMessages((prev) => prev.map((m) => (m.id === id ? { ...m, content } : m)))
+      }
+    }
+
+    const reader = response.body!.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ""
+    try {
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        const events = buffer.split("\n\n")
+        buffer = events.pop() || ""
+
+        for (const rawEvent of events) {
+          const lines = rawEvent.split("\n")
+          const event = lines.find((line) => line.startsWith("event: "))?.slice(7)
+          const dataLine = lines.find((line) => line.startsWith("data: "))
+          if (!event || !dataLine) continue
+          const payload = JSON.parse(dataLine.slice(6))
+
+          if (event === "token") {
+            answer += payload.text
+            show(answer)
+          } else if (event === "done" || event === "error") {
+            show(formatAssistantResponse(payload))
+          }
+        }
+      }
+    } finally {
+      setIsStreaming(false)
+    }
+
+    if (assistantId === null) {
+      addAssistantMessage(formatAssistantResponse({}))
+    }
+  }
+
   const handleSendMessage = async () => {
     if (!inputMessage.trim() || !selectedBook) return
 
@@ -287,7 +376,7 @@ export default function ChatPage() {
     // Real API call to Flask backend
     try {
       const backendUrl = getBackendUrl()
-      const response = await fetch(`${backendUrl}/chat`, {
+      const sendChat = () => fetch(`${backendUrl}/chat/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -301,33 +390,37 @@ export default function ChatPage() {
           author: selectedBook.author,
         }),
       })
+      const isEventStream = (res: Response) => (res.headers.get("content-type") || "").includes("text/event-stream")
+      let response = await sendChat()
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`)
       }
 
-      const data = await response.json()
-
-      let assistantResponse = ""
-      if (data.error) {
-        assistantResponse = `❌ **Error:** ${data.error}\n\nPlease try:\n• Selecting a different book\n• Rephrasing your question\n• Checking if the backend is running`
-      } else {
-        assistantResponse = data.answer || "I couldn't generate a response. Please try again."
-        
-        // Add source information if available
-        if (data.metadata && data.metadata.pdf_used) {
-          assistantResponse += `\n\n📖 **Source:** ${selectedBook.title} by ${selectedBook.author}`
+      // The book is still being indexed in the background: wait for the job, then ask again
+      if (!isEventStream(response)) {
+        const data = await response.json()
+        if (data.status === "processing" && data.job_id) {
+          const job = await waitForJob(backendUrl, data.job_id)
+          if (job.status !== "completed") {
+            addAssistantMessage(formatAssistantResponse({ error: job.error || "Failed to prepare this book" }))
+            return
+          }
+          response = await sendChat()
+          if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`)
+          }
+        } else {
+          addAssistantMessage(formatAssistantResponse(data))
+          return
         }
       }
 
-      const assistantMessage: Message = {
-        id: (Date.now() + 1).toString(),
-        type: "assistant",
-        content: assistantResponse,
-        timestamp: new Date(),
+      if (isEventStream(response)) {
+        await readChatStream(response)
+      } else {
+        addAssistantMessage(formatAssistantResponse(await response.json()))
       }
-
-      setMessages((prev) => [...prev, assistantMessage])
     } catch (error) {
       console.error('Error calling RAG API:', error)
       
@@ -479,7 +572,7 @@ export default function ChatPage() {
               </div>
             ))}
 
-            {isLoading && (
+            {isLoading && !isStreaming && (
               <div className="flex justify-start">
                 <div className="flex items-start space-x-3">
                   <div className="flex-shrink-0 w-10 h-10 rounded-full bg-gradient-to-r from-green-500 to-green-600 flex items-center justify-center shadow-lg">
@@ -0,0 +1,99 @@
+"""Embedding backends: Gemini, or a local CPU-only encoder
+
+Every backend is a langchain Embeddings object with a ``model`` tag. The tag
+is part of each index key and saved with each index, so vectors from
+different backends or settings never end up in, or get searched with, the
+same index.
+"""
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from bm25 import tokenize
+from llm_clients import GeminiEmbeddings
+
+EMBEDDING_BACKENDS = ("gemini", "local")
+FEATURE_CACHE_SIZE = 1_000_000
+
+
+def embedding_tag(embeddings):
+    """The model tag of an embeddings object"""
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+class LocalHashEmbeddings(Embeddings):
+    """Feature-hashed word n-grams, encoded in NumPy batches
+
+    Each word n-gram is hashed to one of ``dimension`` buckets with a sign;
+    counts are log-scaled and rows L2-normalized. Deterministic across
+    processes and needs no network, so texts sharing terms get similar vectors
+    at a small fraction of the cost of a remote model.
+    """
+
+    def __init__(self, dimension=768, ngram_range=(1, 2)):
+        self.dimension = dimension
+        self.ngram_range = tuple(ngram_range)
+        self.model = f"local-hash-{dimension}-{self.ngram_range[0]}{self.ngram_range[1]}"
+        self._codes = {}  # n-gram -> signed bucket + 1
+
+    def _code(self, feature):
+        code = self._codes.get(feature)
+        if code is None:
+            digest = zlib.crc32(feature.encode("utf-8"))
+            code = (digest % self.dimension + 1) * (1 if digest >> 31 else -1)
+            if len(self._codes) >= FEATURE_CACHE_SIZE:
+                self._codes.clear()
+            self._codes[feature] = code
+        return code
+
+    def _features(self, text):
+        tokens = tokenize(text)
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(tokens) - n + 1):
+                yield " ".join(tokens[i:i + n])
+
+    def encode(self, texts):
+        """Encode texts into a (len(texts), dimension) float32 matrix of unit rows"""
+        rows, codes = [], []
+        for row, text in enumerate(texts):
+            row_codes = [self._code(feature) for feature in self._features(text)]
+            codes.extend(row_codes)
+            rows.extend([row] * len(row_codes))
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if not codes:
+            return matrix
+
+        # Count each (row, signed bucket) pair once, then scatter log-scaled counts
+        codes = np.asarray(codes, dtype=np.int64)
+        pairs = np.asarray(rows, dtype=np.int64) * (2 * self.dimension + 1) + codes + self.dimension
+        pairs, counts = np.unique(pairs, return_counts=True)
+        rows, codes = np.divmod(pairs, 2 * self.dimension + 1)
+        codes -= self.dimension
+        values = np.sign(codes) * (1.0 + np.log(counts))
+        np.add.at(matrix, (rows, np.abs(codes) - 1), values.astype(np.float32))
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def embed_documents(self, texts):
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def make_embeddings(backend="gemini", model="models/embedding-001", dimension=768):
+    """Embeddings for a backend name"""
+    if backend == "gemini":
+        return GeminiEmbeddings(model)
+    if backend == "local":
+        return LocalHashEmbeddings(dimension)
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
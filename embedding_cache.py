@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from answer_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+class QueryEmbeddingCache:
+    """Question embeddings keyed by (embedding model, normalized question)
+
+    A repeated question skips the embeddings API and goes straight to the
+    search, whichever book or filters it is asked against. The least recently
+    used entries are evicted beyond max_entries. With a path, the cache is
+    loaded at startup and saved every save_every new entries and by save().
+    """
+
+    def __init__(self, max_entries=10000, path=None, save_every=100):
+        self.max_entries = max_entries
+        self.path = path
+        self.save_every = save_every
+        self._entries = OrderedDict()  # (model, normalized question) -> float32 vector
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self.load()
+
+    def get(self, model, question):
+        key = (model, normalize_question(question))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model, question, embedding):
+        key = (model, normalize_question(question))
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._unsaved += 1
+            due = self.path and self._unsaved >= self.save_every
+        if due:
+            self.save()
+
+    def save(self):
+        """Write the cache to its path, one matrix per embedding size"""
+        if not self.path:
+            return
+        with self._lock:
+            items = list(self._entries.items())
+            self._unsaved = 0
+        groups = {}
+        for (model, question), vector in items:
+            groups.setdefault(len(vector), []).append(([model, question], vector))
+        arrays = {}
+        for size, group in groups.items():
+            arrays[f"keys_{size}"] = np.asarray(json.dumps([key for key, _ in group]))
+            arrays[f"vectors_{size}"] = np.vstack([vector for _, vector in group])
+        with self._save_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_file = f"{self.path}.tmp-{os.getpid()}-{threading.get_ident()}.npz"
+            np.savez(tmp_file, **arrays)
+            os.replace(tmp_file, self.path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                for name in data.files:
+                    if not name.startswith("keys_"):
+                        continue
+                    keys = json.loads(str(data[name]))
+                    vectors = data[f"vectors_{name[len('keys_'):]}"]
+                    for (model, question), vector in zip(keys, vectors):
+                        vector.setflags(write=False)
+                        self._entries[(model, question)] = vector
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load query embeddings from {self.path}: {str(e)}")
+            return
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logger.info(f"Loaded {len(self._entries)} cached query embeddings")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
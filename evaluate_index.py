@@ -0,0 +1,121 @@
+"""Compare vector index types on recall and search latency
+
+Uses the vectors of a saved index (from INDEX_CACHE_DIR) or random clustered
+vectors, builds every index type over them and measures recall@k against
+exact search, per-query latency and serialized size.
+
+    python evaluate_index.py --index <key>
+    python evaluate_index.py --synthetic 50000 --dimension 768 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from vector_index import INDEX_TYPES, IndexSpec, index_nbytes, reconstruct_vectors
+
+
+def load_vectors(index_dir):
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"))
+    vectors = reconstruct_vectors(index)
+    if vectors is None:
+        sys.exit(f"{index_dir} is a compressed index; evaluate from a flat, ivf or hnsw build")
+    return vectors
+
+
+def synthetic_vectors(count, dimension, seed=0):
+    """Gaussian clusters, closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 100), dimension)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=count)
+    return centers[labels] + 0.3 * rng.normal(size=(count, dimension)).astype(np.float32)
+
+
+def sample_queries(vectors, count, seed=1):
+    """Perturbed copies of stored vectors, so that queries resemble real questions about the text"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+    scale = float(np.std(vectors)) * 0.1
+    return vectors[picks] + scale * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+
+
+def evaluate(spec, vectors, queries, truth, k):
+    started = time.perf_counter()
+    index, info = spec.train(vectors)
+    index.add(vectors)
+    build_seconds = time.perf_counter() - started
+
+    # Single-threaded single queries, as each request is served
+    threads = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(1)
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(set(found[0].tolist()) & set(expected.tolist())) / k)
+    faiss.omp_set_num_threads(threads)
+
+    latencies = np.asarray(latencies)
+    return {
+        "index_type": spec.index_type,
+        "faiss_index": info["faiss_index"],
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+        "build_seconds": round(build_seconds, 3),
+        "bytes": index_nbytes(index),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--index", help="key of a saved index in the index cache")
+    source.add_argument("--synthetic", type=int, metavar="N", help="evaluate on N random clustered vectors")
+    parser.add_argument("--dimension", type=int, default=768, help="dimension of synthetic vectors")
+    parser.add_argument("--cache-dir", default=os.getenv("INDEX_CACHE_DIR", "faiss_indexes"))
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="comma-separated index types")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=int(os.getenv("IVF_NPROBE", "8")))
+    parser.add_argument("--ef-search", type=int, default=int(os.getenv("HNSW_EF_SEARCH", "64")))
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--pq-m", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    if args.index:
+        vectors = load_vectors(os.path.join(args.cache_dir, args.index))
+    else:
+        vectors = synthetic_vectors(args.synthetic, args.dimension)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = sample_queries(vectors, args.queries)
+    k = min(args.k, len(vectors))
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for index_type in args.types.split(","):
+        spec = IndexSpec(index_type.strip(), nlist=args.nlist, pq_m=args.pq_m,
+                         nprobe=args.nprobe, ef_search=args.ef_search)
+        results.append(evaluate(spec, vectors, queries, truth, k))
+
+    if args.json:
+        print(json.dumps({"vectors": len(vectors), "dimension": vectors.shape[1], "results": results}, indent=2))
+        return
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries")
+    print(f"{'type':<7} {'faiss index':<16} {f'recall@{k}':>10} {'p50 ms':>8} {'p95 ms':>8} {'build s':>8} {'MB':>8}")
+    for r in results:
+        print(f"{r['index_type']:<7} {r['faiss_index']:<16} {r[f'recall@{k}']:>10.3f} {r['latency_ms_p50']:>8.3f} "
+              f"{r['latency_ms_p95']:>8.3f} {r['build_seconds']:>8.2f} {r['bytes'] / 1024 ** 2:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
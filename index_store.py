@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from bm25 import BM25Index
+
+logger = logging.getLogger(__name__)
+
+
+def load_faiss(folder_path, embeddings):
+    """Load a saved FAISS index, handling older langchain signatures"""
+    from langchain_community.vectorstores import FAISS
+    try:
+        return FAISS.load_local(folder_path, embeddings, allow_dangerous_deserialization=True)
+    except TypeError:
+        # Fallback for older FAISS versions
+        return FAISS.load_local(folder_path, embeddings)
+
+
+def file_signature(path):
+    """(path, size, mtime) of a file, or (path, None, None) if it is missing; changes when it is rewritten"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return os.path.abspath(path), None, None
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+class IndexStore:
+    """Persistent vector indexes keyed by PDF content hash and build parameters"""
+
+    HASH_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, root="faiss_indexes"):
+        self.root = root
+        self._hash_cache = {}
+        self._lock = threading.Lock()
+
+    def file_hash(self, pdf_path):
+        """Return the SHA-256 of a file, cached by path, size and mtime"""
+        cache_key = file_signature(pdf_path)
+        if cache_key[1] is None:
+            raise FileNotFoundError(pdf_path)
+        with self._lock:
+            cached = self._hash_cache.get(cache_key)
+        if cached:
+            return cached
+
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(self.HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+
+        with self._lock:
+            self._hash_cache[cache_key] = content_hash
+        return content_hash
+
+    def index_key(self, pdf_path, params):
+        """Build the cache key for a PDF and its chunking/embedding parameters"""
+        payload = json.dumps({"content_hash": self.file_hash(pdf_path), **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def library_key(self, books, params):
+        """Build the cache key for an index over several PDFs, given (pdf_path, params) for each"""
+        payload = json.dumps({
+            "books": [[self.file_hash(pdf_path), book_params] for pdf_path, book_params in books],
+            **params
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def index_path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        path = self.index_path(key)
+        return os.path.exists(os.path.join(path, "index.faiss")) and os.path.exists(os.path.join(path, "meta.json"))
+
+    def read_metadata(self, key):
+        try:
+            with open(os.path.join(self.index_path(key), "meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, vector_store, metadata=None, lexical_index=None):
+        """Save a vector store (and its BM25 index) under its key, replacing any partial previous build"""
+        final_path = self.index_path(key)
+        tmp_path = f"{final_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(self.root, exist_ok=True)
+
+        vector_store.save_local(tmp_path)
+        if lexical_index is not None:
+            lexical_index.save(os.path.join(tmp_path, "bm25.npz"))
+        meta = dict(metadata or {})
+        meta["key"] = key
+        meta["created_at"] = time.time()
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        # Publish the finished directory in one step so readers never see half an index
+        if os.path.exists(final_path):
+            shutil.rmtree(final_path, ignore_errors=True)
+        os.replace(tmp_path, final_path)
+        logger.info(f"Saved vector index {key} to {final_path}")
+        return final_path
+
+    def index_size(self, key):
+        """Size in bytes of a saved index, used as an estimate of its memory footprint"""
+        path = self.index_path(key)
+        total = 0
+        for name in os.listdir(path):
+            total += os.path.getsize(os.path.join(path, name))
+        return total
+
+    def load(self, key, embeddings):
+        return load_faiss(self.index_path(key), embeddings)
+
+    def load_lexical(self, key):
+        """Load the BM25 index saved next to a vector index, or None for older builds"""
+        path = os.path.join(self.index_path(key), "bm25.npz")
+        if not os.path.exists(path):
+            return None
+        return BM25Index.load(path)
+
+    def save_lexical(self, key, lexical_index):
+        """Add a BM25 index to an existing build"""
+        path = os.path.join(self.index_path(key), "bm25.npz")
+        tmp_file = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}.npz"
+        lexical_index.save(tmp_file)
+        os.replace(tmp_file, path)
+
+    def remove(self, key):
+        shutil.rmtree(self.index_path(key), ignore_errors=True)
+
+    def read_pointer(self, name):
+        """The key last recorded under a name, e.g. the latest library build, or None"""
+        try:
+            with open(os.path.join(self.root, f"{name}.json"), "r", encoding="utf-8") as f:
+                return json.load(f).get("key")
+        except (OSError, ValueError):
+            return None
+
+    def write_pointer(self, name, key):
+        path = os.path.join(self.root, f"{name}.json")
+        tmp_file = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "updated_at": time.time()}, f)
+        os.replace(tmp_file, path)
@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BATCH_FILE = re.compile(r"batch-(\d{6})\.npy")
+RATE_LIMIT_MARKERS = ("429", "resource exhausted", "resourceexhausted", "quota", "rate limit", "too many requests")
+
+
+def is_rate_limit_error(error):
+    """Whether an embeddings API error means we are being throttled"""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that halves on throttling and creeps back up on success"""
+
+    def __init__(self, max_concurrency, recover_after=5):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.recover_after = recover_after
+        self._active = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self._active < self.limit:
+                    self._active += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, throttled=False, backoff=0.0):
+        with self._cond:
+            self._active -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+                self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+            else:
+                self._successes += 1
+                if self._successes >= self.recover_after and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class EmbeddingPipeline:
+    """Embeds text chunks in batches with bounded concurrency, backoff and checkpoints
+
+    Any object with an ``embed_documents(texts)`` method can be used as the
+    embedder, including local stubs. When a checkpoint key is given, every
+    finished batch is written to disk so a failed ingest resumes from the
+    batches that already completed.
+    """
+
+    def __init__(self, embeddings, batch_size=100, max_concurrency=4, max_retries=6,
+                 base_delay=1.0, max_delay=60.0, checkpoint_dir=None):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.checkpoint_dir = checkpoint_dir
+
+    def _checkpoint_path(self, checkpoint_key):
+        if not self.checkpoint_dir or not checkpoint_key:
+            return None
+        return os.path.join(self.checkpoint_dir, checkpoint_key)
+
+    def _load_checkpoint(self, path, total):
+        """Return {batch_index: vectors} for batches finished by a previous run"""
+        done = {}
+        if not path or not os.path.isdir(path):
+            return done
+        try:
+            with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return done
+        if manifest.get("batch_size") != self.batch_size or manifest.get("total") != total:
+            logger.info(f"Ignoring checkpoint {path}: batch layout changed")
+            return done
+        for name in os.listdir(path):
+            match = BATCH_FILE.fullmatch(name)
+            if match:
+                try:
+                    done[int(match.group(1))] = np.load(os.path.join(path, name))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Re-embedding unreadable checkpoint batch {name}: {str(e)}")
+            elif name.endswith(".npy"):
+                # Left behind by a save that crashed before it was renamed
+                os.remove(os.path.join(path, name))
+        return done
+
+    def _start_checkpoint(self, path, total):
+        if not path:
+            return
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"batch_size": self.batch_size, "total": total}, f)
+
+    def _save_batch(self, path, batch_index, vectors):
+        if not path:
+            return
+        tmp_file = os.path.join(path, f".tmp-batch-{batch_index:06d}-{threading.get_ident()}.npy")
+        np.save(tmp_file, vectors)
+        os.replace(tmp_file, os.path.join(path, f"batch-{batch_index:06d}.npy"))
+
+    def clear_checkpoint(self, checkpoint_key):
+        path = self._checkpoint_path(checkpoint_key)
+        if path and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _embed_batch(self, limiter, texts):
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    limiter.release()
+                    raise
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                attempt += 1
+                logger.warning(f"Embeddings API throttled, retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+                limiter.release(throttled=True, backoff=delay)
+                continue
+            limiter.release()
+            return np.asarray(vectors, dtype=np.float32)
+
+    def embed(self, texts, checkpoint_key=None, progress=None):
+        """Embed texts and return an (n, dim) float32 array in input order
+
+        progress, if given, is called with the number of texts embedded so far.
+        """
+        total = len(texts)
+        batches = [(i, texts[start:start + self.batch_size])
+                   for i, start in enumerate(range(0, total, self.batch_size))]
+        path = self._checkpoint_path(checkpoint_key)
+        results = self._load_checkpoint(path, total)
+        if results:
+            logger.info(f"Resuming embedding from checkpoint: {len(results)}/{len(batches)} batches done")
+        else:
+            self._start_checkpoint(path, total)
+
+        done_count = sum(len(batches[i][1]) for i in results)
+        lock = threading.Lock()
+        if progress:
+            progress(done_count)
+
+        limiter = AdaptiveLimiter(self.max_concurrency)
+
+        def run(batch_index, batch_texts):
+            nonlocal done_count
+            vectors = self._embed_batch(limiter, batch_texts)
+            self._save_batch(path, batch_index, vectors)
+            with lock:
+                results[batch_index] = vectors
+                done_count += len(batch_texts)
+                if progress:
+                    progress(done_count)
+
+        todo = [batch for batch in batches if batch[0] not in results]
+        if todo:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = [executor.submit(run, i, batch_texts) for i, batch_texts in todo]
+                errors = [f.exception() for f in futures if f.exception() is not None]
+            if errors:
+                raise errors[0]
+
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack([results[i] for i in range(len(batches))])
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import trace
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """A background ingestion job and its progress"""
+
+    def __init__(self, key, description):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.description = description
+        self.status = "queued"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def update(self, **fields):
+        """Record progress fields such as pages_extracted or chunks_embedded"""
+        with self._lock:
+            self.progress.update(fields)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "description": self.description,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class JobManager:
+    """Runs ingestion work on background threads, one active job per key"""
+
+    def __init__(self, max_workers=1, max_finished=200):
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, description, fn):
+        """Schedule fn(job) unless a job for the same key is already queued or running"""
+        with self._lock:
+            existing = self._active.get(key)
+            if existing is not None:
+                return existing
+            job = Job(key, description)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._prune_locked()
+        self._executor.submit(self._run, job, fn)
+        logger.info(f"Queued job {job.id}: {description}")
+        return job
+
+    def _run(self, job, fn):
+        with trace(job.id[:16]):
+            self._run_traced(job, fn)
+
+    def _run_traced(self, job, fn):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            result = fn(job)
+            if result is False:
+                raise RuntimeError("Ingestion failed. Check server logs for details.")
+            job.result = result if result is not True else None
+            job.status = "completed"
+            logger.info(f"Job {job.id} completed: {job.description}")
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+            job._done.set()
+
+    def _prune_locked(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_job(self, key):
+        with self._lock:
+            return self._active.get(key)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def status_counts(self):
+        """Number of known jobs in each status"""
+        counts = dict.fromkeys(("queued", "running", "completed", "failed"), 0)
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
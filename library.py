@@ -0,0 +1,79 @@
+import hashlib
+import json
+
+import numpy as np
+
+from catalog import normalize, to_roman
+
+FILTER_FIELDS = ("semester", "subject", "book", "author", "source_pdf")
+
+
+def chunk_metadata(entry, metadata):
+    """Metadata for one chunk of a catalog entry in the library index"""
+    return dict(metadata, source_pdf=entry["path"], semester=entry.get("semester"), subject=entry.get("subject"),
+                book=entry.get("title"), author=entry.get("author"))
+
+
+def clean_filters(filters):
+    """Drop empty filter values and put semesters and subjects in catalog form"""
+    cleaned = {}
+    for field in FILTER_FIELDS:
+        value = (filters or {}).get(field)
+        if not value:
+            continue
+        if field == "semester":
+            value = to_roman(value)
+        elif field == "subject":
+            value = str(value).upper()
+        cleaned[field] = value
+    return cleaned
+
+
+def filter_signature(filters):
+    """Stable string for a set of filters, used in answer cache keys"""
+    return hashlib.sha256(json.dumps(filters, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class MetadataColumns:
+    """Chunk metadata of a library index as columns of integer codes
+
+    Filters are resolved against each column's small vocabulary first and then
+    applied to all chunks at once, giving the FAISS positions to search.
+    Semester, subject and source_pdf must match exactly; book and author
+    match on normalized substrings, like the catalog's partial lookups.
+    Chunks of books removed from the library are never matched.
+    """
+
+    def __init__(self, metadatas):
+        self.count = len(metadatas)
+        self.live = np.fromiter((not metadata.get("deleted") for metadata in metadatas), dtype=bool,
+                                count=self.count)
+        self.vocabularies = {}
+        self.codes = {}
+        for field in FILTER_FIELDS:
+            vocabulary = {}
+            codes = np.empty(self.count, dtype=np.int32)
+            for position, metadata in enumerate(metadatas):
+                codes[position] = vocabulary.setdefault(metadata.get(field), len(vocabulary))
+            self.vocabularies[field] = vocabulary
+            self.codes[field] = codes
+
+    def _matching_codes(self, field, value):
+        vocabulary = self.vocabularies[field]
+        if field in ("book", "author"):
+            wanted = normalize(value)
+            return [code for item, code in vocabulary.items() if item and wanted in normalize(item)]
+        code = vocabulary.get(value)
+        return [] if code is None else [code]
+
+    def positions(self, filters):
+        """Positions of the live chunks matching every filter, or None when every chunk may be returned"""
+        if not filters and self.live.all():
+            return None
+        mask = self.live.copy()
+        for field, value in (filters or {}).items():
+            mask &= np.isin(self.codes[field], self._matching_codes(field, value))
+        return np.flatnonzero(mask).astype(np.int64)
+
+    def nbytes(self):
+        return int(sum(codes.nbytes for codes in self.codes.values()) + self.live.nbytes)
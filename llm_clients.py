@@ -0,0 +1,208 @@
+"""Shared Gemini clients
+
+The Gemini SDK and langchain's chains take about a second to import, so they
+are imported when a client is first needed rather than when the app loads.
+"""
+import logging
+import os
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Transport for the Gemini client. "grpc" keeps one multiplexed HTTP/2 channel
+# open for the whole process; "rest" uses a pooled HTTP session instead.
+GENAI_TRANSPORT = os.getenv("GENAI_TRANSPORT", "grpc")
+MODEL_DISCOVERY_TTL = int(os.getenv("MODEL_DISCOVERY_TTL", "3600"))
+MODEL_DISCOVERY_RETRY = 60  # seconds before a failed model listing is tried again
+
+_genai_configured = False
+_genai_lock = threading.Lock()
+
+
+def configure_genai():
+    """Configure the Gemini SDK with the API key and GENAI_TRANSPORT, once per process
+
+    genai.configure() drops every client the SDK has made, and with them their
+    open connections. langchain's Gemini classes call it when constructed, so
+    they are given the same transport and are constructed once.
+    """
+    global _genai_configured
+    with _genai_lock:
+        if not _genai_configured:
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"), transport=GENAI_TRANSPORT)
+            _genai_configured = True
+
+
+class LLMClientCache:
+    """Builds chat models and QA chains once per configuration and shares them
+
+    Constructing ChatGoogleGenerativeAI re-runs genai.configure(), which throws
+    away the client (and its open connection) that previous requests were
+    using, so models are created once and reused across threads. Models and
+    "stuff" QA chains hold no per-request state, which makes sharing them safe.
+    """
+
+    def __init__(self, transport=GENAI_TRANSPORT):
+        self.transport = transport
+        self._models = {}
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def get_chat_model(self, model_name, temperature):
+        key = (model_name, temperature)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                logger.info(f"Creating chat model {model_name} (temperature={temperature})")
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                model = ChatGoogleGenerativeAI(model=model_name, temperature=temperature, transport=self.transport)
+                self._models[key] = model
+            return model
+
+    def set_chat_model(self, model_name, temperature, model):
+        """Serve a given model, such as a local stand-in, for a configuration"""
+        with self._lock:
+            self._models[(model_name, temperature)] = model
+            for key in [key for key in self._chains if key[:2] == (model_name, temperature)]:
+                del self._chains[key]
+
+    def get_qa_chain(self, model_name, temperature, prompt_template):
+        key = (model_name, temperature, prompt_template)
+        chain = self._chains.get(key)
+        if chain is not None:
+            return chain
+        model = self.get_chat_model(model_name, temperature)
+        with self._lock:
+            chain = self._chains.get(key)
+            if chain is None:
+                from langchain.chains.question_answering import load_qa_chain
+                from langchain.prompts import PromptTemplate
+                try:
+                    prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
+                    chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
+                except Exception as e:
+                    logger.error(f"Error creating chain with custom prompt: {e}")
+                    # Fallback to default chain
+                    chain = load_qa_chain(model, chain_type="stuff")
+                self._chains[key] = chain
+            return chain
+
+
+class GeminiEmbeddings(Embeddings):
+    """GoogleGenerativeAIEmbeddings, created on first use
+
+    Lets RAGSystem hand an embeddings object to FAISS stores and the
+    ingestion pipeline at startup without importing the Gemini SDK.
+    """
+
+    def __init__(self, model, task_type=None):
+        self.model = model
+        self.task_type = task_type
+        self._client = None
+        self._queries = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                    self._client = GoogleGenerativeAIEmbeddings(model=self.model, task_type=self.task_type,
+                                                                transport=GENAI_TRANSPORT)
+        return self._client
+
+    def for_queries(self):
+        """Embeddings that embed every text as a search query, e.g. to embed many questions in one call"""
+        if self.task_type == "retrieval_query":
+            return self
+        with self._lock:
+            if self._queries is None:
+                self._queries = GeminiEmbeddings(self.model, "retrieval_query")
+            return self._queries
+
+    def embed_documents(self, texts):
+        return self.client.embed_documents(texts)
+
+    def embed_query(self, text):
+        # langchain-google-genai 0.0.11 embeds with the client's task type whatever
+        # embed_query asks for, so queries go through a retrieval_query client
+        return self.for_queries().client.embed_documents([text])[0]
+
+
+class ModelDiscovery:
+    """The Gemini models that can generate content, cached for a TTL
+
+    The first lookup lists the models synchronously; after that, stale
+    results are served while a background thread refreshes them, so a request
+    never waits on genai.list_models().
+    """
+
+    def __init__(self, ttl=MODEL_DISCOVERY_TTL):
+        self.ttl = ttl
+        self._models = None
+        self._error = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def refresh(self):
+        """List the models now; returns them, or raises if the API call fails"""
+        try:
+            import google.generativeai as genai
+            configure_genai()
+            models = [{
+                "name": model.name,
+                "display_name": model.display_name,
+                "description": getattr(model, 'description', 'No description'),
+                "supported_methods": model.supported_generation_methods
+            } for model in genai.list_models() if 'generateContent' in model.supported_generation_methods]
+        except Exception as e:
+            with self._lock:
+                self._error = e
+                self._fetched_at = time.monotonic()
+                self._refreshing = False
+            raise
+        with self._lock:
+            self._models = models
+            self._error = None
+            self._fetched_at = time.monotonic()
+            self._refreshing = False
+        logger.info(f"Available Gemini models: {[model['name'] for model in models]}")
+        return models
+
+    def refresh_in_background(self):
+        """Start a refresh unless one is already running"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Could not refresh the Gemini model list: {str(e)}")
+
+        threading.Thread(target=run, name="model-discovery", daemon=True).start()
+
+    def models(self):
+        """Cached model list; raises the last error if the models have never been listed"""
+        with self._lock:
+            models, error = self._models, self._error
+            ttl = self.ttl if error is None else min(self.ttl, MODEL_DISCOVERY_RETRY)
+            stale = time.monotonic() - self._fetched_at > ttl
+        if models is None and (error is None or stale):
+            return self.refresh()
+        if stale:
+            self.refresh_in_background()
+        if models is None:
+            raise error
+        return models
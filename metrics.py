@@ -0,0 +1,244 @@
+"""Process metrics in the Prometheus text format, and trace IDs for logs
+
+A small in-process implementation (counters, gauges, histograms and gauges
+read from callbacks) so that /metrics needs no extra dependency.
+"""
+import contextvars
+import logging
+import math
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, math.inf)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_text(self.label_names, key)} {_format_value(value)}"
+                                for key, value in items]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class CallbackGauge(_Metric):
+    """A gauge whose samples are read when rendering: fn() returns a number or {label value(s): number}"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, help_text, fn, label_names=()):
+        super().__init__(name, help_text, label_names)
+        self.fn = fn
+
+    def render(self):
+        try:
+            samples = self.fn()
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Could not collect {self.name}: {str(e)}")
+            return []
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        lines = self.header()
+        for key, value in sorted(samples.items(), key=lambda item: str(item[0])):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_label_text(self.label_names, key)} {_format_value(value or 0)}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(set(buckets) | {math.inf}))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_label_text(self.label_names, key, {'le': _format_value(bound)})} "
+                             f"{count}")
+            lines.append(f"{self.name}_sum{_label_text(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.label_names, key)} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._register(Gauge(name, help_text, label_names))
+
+    def gauge_callback(self, name, help_text, fn, label_names=()):
+        return self._register(CallbackGauge(name, help_text, fn, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "eduvision_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+QUERY_PATHS = REGISTRY.counter(
+    "eduvision_query_path_total", "How questions were answered: cache, chain, direct fallback or failure", ["path"])
+RETRIEVAL_FALLBACKS = REGISTRY.counter(
+    "eduvision_retrieval_fallback_total", "Retrievals that degraded to another mode", ["reason"])
+COALESCED = REGISTRY.counter(
+    "eduvision_coalesced_total", "Calls that waited for an identical call already in flight", ["kind"])
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "eduvision_http_requests_in_flight", "Requests currently being handled", ["endpoint"])
+HTTP_SECONDS = REGISTRY.histogram(
+    "eduvision_http_request_seconds", "Request duration, including streamed bodies", ["endpoint", "method", "status"])
+
+
+class StartupTimer:
+    """How long each startup phase took, from a start time taken before the heavy imports"""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = {}
+        self._last = self.started
+
+    def mark(self, phase):
+        """Record the time since the previous mark as phase"""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    def report(self):
+        report = {phase: round(seconds, 4) for phase, seconds in self.phases.items()}
+        report["total"] = round(self._last - self.started, 4)
+        return report
+
+
+def stage(name):
+    """Context manager timing one pipeline stage"""
+    return STAGE_SECONDS.time(stage=name)
+
+
+# Trace IDs follow a request (or a background job) through every log line
+trace_id_var = contextvars.ContextVar("trace_id", default="-")
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def trace(trace_id=None):
+    """Run a block with a trace ID attached to its log records"""
+    token = trace_id_var.set(trace_id or new_trace_id())
+    try:
+        yield trace_id_var.get()
+    finally:
+        trace_id_var.reset(token)
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+def install_trace_logging():
+    """Add the trace ID to every record handled by the root logger's handlers"""
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
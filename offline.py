@@ -0,0 +1,85 @@
+"""Deterministic local stand-ins for the Gemini embeddings and chat model
+
+Used to run the pipeline without network access, e.g. for benchmarks. An
+optional latency simulates the round trip of the real API; the async methods
+wait without holding a thread, like a network call would.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from embedding_backends import LocalHashEmbeddings
+
+
+class StubEmbeddings(LocalHashEmbeddings):
+    """Hashed bag-of-words vectors with a simulated API latency"""
+
+    def __init__(self, size=768, latency=0.0):
+        super().__init__(dimension=size, ngram_range=(1, 1))
+        self.size = size
+        self.latency = latency
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_documents(self, texts):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    async def aembed_query(self, text):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class StubChatModel(SimpleChatModel):
+    """Answers with the opening words of the prompt's context"""
+
+    latency: float = 0.0
+    answer_words: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat-model"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        prompt = " ".join(str(message.content) for message in messages)
+        return " ".join(prompt.split()[:self.answer_words])
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+              **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for word in self._answer(messages).split():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for word in self._answer(messages).split():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
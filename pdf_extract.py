@@ -0,0 +1,93 @@
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+PAGES_PER_TASK = 25
+# Extraction runs on ingestion threads of a server holding gRPC channels, where forking is
+# unsafe, so workers are started fresh. Starting them imports the main module again, so
+# each pool is kept for the life of the process instead of one per PDF.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def count_pages(pdf_path):
+    from PyPDF2 import PdfReader
+    return len(PdfReader(pdf_path).pages)
+
+
+def iter_pdf_pages(pdf_path, start=0, end=None):
+    """Yield (page_number, text) for pages[start:end], numbering pages from 1"""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(pdf_path)
+    pages = reader.pages
+    end = len(pages) if end is None else min(end, len(pages))
+    for index in range(start, end):
+        try:
+            text = pages[index].extract_text() or ""
+        except Exception as e:
+            logger.warning(f"Could not extract page {index + 1} of {pdf_path}: {str(e)}")
+            text = ""
+        yield index + 1, text
+
+
+def _extract_range(pdf_path, start, end):
+    """Process pool worker: extract one contiguous range of pages"""
+    return list(iter_pdf_pages(pdf_path, start, end))
+
+
+def _pool(workers):
+    """The process pool with this many workers, shared by every extraction"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD))
+        return pool
+
+
+def _discard_pool(workers, pool):
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_pages(pdf_path, workers=None, pages_per_task=PAGES_PER_TASK):
+    """Yield (page_number, text) in page order, fanning page ranges out to a process pool
+
+    At most two ranges per worker are in flight at once, so memory stays bounded
+    by the pages waiting to be consumed rather than by the size of the book.
+    """
+    workers = workers or os.cpu_count() or 1
+    total = count_pages(pdf_path)
+
+    if workers <= 1 or total <= pages_per_task:
+        yield from iter_pdf_pages(pdf_path)
+        return
+
+    ranges = deque((start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task))
+    in_flight = min(workers, len(ranges)) * 2
+    executor = _pool(workers)
+    pending = deque()
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < in_flight:
+                start, end = ranges.popleft()
+                pending.append(executor.submit(_extract_range, pdf_path, start, end))
+            for page in pending.popleft().result():
+                yield page
+    except BrokenProcessPool:
+        # A worker died; the next extraction starts a new pool
+        _discard_pool(workers, executor)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
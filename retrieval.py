@@ -0,0 +1,134 @@
+import threading
+
+import numpy as np
+
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+
+
+def _search_parameters(index, positions):
+    """FAISS search parameters restricting results to positions, keeping the index's own settings"""
+    import faiss
+    selector = faiss.IDSelectorBatch(len(positions), faiss.swig_ptr(positions))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe), selector
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch), selector
+    return faiss.SearchParameters(sel=selector), selector
+
+
+def vector_search_batch(store, embeddings, k, positions=None):
+    """Search a FAISS store directly for many query embeddings at once, as a single matrix search
+
+    Returns one list of (position, distance) pairs per embedding, closest first.
+    positions, if given, is an int64 array of the only positions that may be returned.
+    """
+    if store.index.ntotal == 0 or (positions is not None and not len(positions)):
+        return [[] for _ in embeddings]
+    queries = np.asarray(embeddings, dtype=np.float32)
+    if positions is None:
+        distances, found = store.index.search(queries, min(k, store.index.ntotal))
+    else:
+        # The selector holds a pointer into positions, which must outlive the search
+        params, _selector = _search_parameters(store.index, positions)
+        distances, found = store.index.search(queries, min(k, len(positions)), params=params)
+    return [[(int(p), float(d)) for p, d in zip(row_found, row_distances) if p != -1]
+            for row_found, row_distances in zip(found, distances)]
+
+
+_direct_map_lock = threading.Lock()
+
+
+def candidate_vectors(index, positions):
+    """Vectors stored at positions, or None if the index cannot return them
+
+    Compressed (PQ) indexes return their approximations. IVF indexes get a
+    direct map on first use so vectors can be looked up by position.
+    """
+    import faiss
+    try:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            with _direct_map_lock:
+                if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                    ivf.make_direct_map()
+        return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+    except RuntimeError:
+        return None
+
+
+def mmr_order(relevance, vectors, lambda_mult=0.7):
+    """Order candidates by maximal marginal relevance
+
+    relevance holds each candidate's score for the query, scaled to [0, 1].
+    Each step picks the candidate maximizing lambda_mult * relevance minus
+    (1 - lambda_mult) * its highest cosine similarity to those already picked,
+    using one similarity matrix over all candidates. Returns candidate indices.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    similarity = vectors @ vectors.T
+    redundancy = np.zeros(len(vectors), dtype=np.float32)  # highest similarity to a picked candidate
+    remaining = np.ones(len(vectors), dtype=bool)
+
+    order = []
+    for _ in range(len(vectors)):
+        scores = np.where(remaining, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        chosen = int(np.argmax(scores))
+        redundancy = np.maximum(redundancy, similarity[chosen]) if order else similarity[chosen]
+        order.append(chosen)
+        remaining[chosen] = False
+    return order
+
+
+def diversify(store, query_embedding, ranked, lambda_mult=0.7, min_similarity=None):
+    """Rerank (position, score) candidates, best first, by MMR over their stored vectors
+
+    The incoming scores (fused, vector or lexical) are the relevance term, so
+    MMR only trades them off against redundancy. Candidates whose cosine
+    similarity to the query is below min_similarity are dropped, except the
+    best. Returns the kept pairs with their scores, in MMR order, or ranked
+    unchanged if the index cannot return its vectors.
+    """
+    if len(ranked) < 2:
+        return ranked
+    vectors = candidate_vectors(store.index, [position for position, _ in ranked])
+    if vectors is None:
+        return ranked
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    if min_similarity is not None:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        keep = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12)) >= min_similarity
+        keep[0] = True
+        ranked = [pair for pair, kept in zip(ranked, keep) if kept]
+        vectors = vectors[keep]
+
+    scores = np.asarray([score for _, score in ranked], dtype=np.float32)
+    spread = float(scores.max() - scores.min())
+    relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+    return [ranked[i] for i in mmr_order(relevance, vectors, lambda_mult)]
+
+
+def doc_at(store, position):
+    """The Document stored at a FAISS position"""
+    return store.docstore.search(store.index_to_docstore_id[position])
+
+
+def store_texts(store):
+    """Chunk texts of a FAISS store in position order"""
+    return [doc_at(store, position).page_content for position in range(store.index.ntotal)]
+
+
+def store_metadatas(store):
+    """Chunk metadata of a FAISS store in position order"""
+    return [doc_at(store, position).metadata for position in range(store.index.ntotal)]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merge ranked lists of positions into (position, fused_score) pairs, best first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
@@ -0,0 +1,83 @@
+"""Coalescing of duplicate in-flight work
+
+Concurrent callers asking for the same key share one execution: the first
+caller runs the work and the others wait for its result. An exception raised
+by the work is raised in every caller.
+"""
+import asyncio
+import threading
+
+from metrics import COALESCED
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Single-flight for threads"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return fn(), or the result of the identical call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            COALESCED.inc(kind=self.kind)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """Single-flight for coroutines on one event loop
+
+    The work runs as its own task, so a caller that is cancelled (e.g. its
+    client disconnected) does not cancel it for the others. It is cancelled
+    only once every caller waiting on it has been.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._calls = {}  # key -> [task, number of callers waiting]
+
+    async def do(self, key, factory):
+        """Await factory(), or the identical call already in flight"""
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(factory())
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is call else None)
+        else:
+            COALESCED.inc(kind=self.kind)
+        call[1] += 1
+        try:
+            return await asyncio.shield(call[0])
+        except asyncio.CancelledError:
+            if not call[0].done() and call[1] == 1:
+                call[0].cancel()
+            raise
+        finally:
+            call[1] -= 1
@@ -0,0 +1,165 @@
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer; waiting writers block new readers"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class VectorStoreRegistry:
+    """Keeps recently used vector stores in memory with LRU eviction
+
+    The registry is bounded both by the number of resident stores and by their
+    total estimated size in bytes. Each key has its own reader/writer lock:
+    searches hold the read side, while loading or replacing a store holds the
+    write side, so work on one document never blocks queries on another.
+    """
+
+    def __init__(self, max_entries=8, max_bytes=2 * 1024 ** 3):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._stores = OrderedDict()  # key -> (store, nbytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lock_for(self, key):
+        """The reader/writer lock guarding one document's store"""
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = ReadWriteLock()
+            return lock
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._stores.get(key)
+            if entry is not None:
+                self._stores.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            return None
+
+    def get(self, key, loader):
+        """Return the store for key, calling loader() -> (store, nbytes) on a miss"""
+        store = self._lookup(key)
+        if store is not None:
+            return store
+
+        # Load under this key's write lock only, so other documents stay available
+        with self.lock_for(key).write():
+            store = self._lookup(key)
+            if store is not None:
+                return store
+            with self._lock:
+                self.misses += 1
+            store, nbytes = loader()
+            self._insert(key, store, nbytes)
+            return store
+
+    @contextmanager
+    def reading(self, key, loader):
+        """Context manager yielding the store for key while holding its read lock"""
+        while True:
+            store = self.get(key, loader)
+            lock = self.lock_for(key)
+            with lock.read():
+                # The store may have been replaced between get() and acquiring the lock
+                current = self.peek(key)
+                if current is store or current is None:
+                    yield store
+                    return
+
+    def peek(self, key):
+        """Return a resident store without loading it or touching LRU order"""
+        with self._lock:
+            entry = self._stores.get(key)
+            return entry[0] if entry is not None else None
+
+    def put(self, key, store, nbytes):
+        """Insert or replace a store, waiting for in-flight readers of that key"""
+        with self.lock_for(key).write():
+            self._insert(key, store, nbytes)
+
+    def _insert(self, key, store, nbytes):
+        with self._lock:
+            old = self._stores.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._stores[key] = (store, nbytes)
+            self._total_bytes += nbytes
+            self._evict_locked(keep=key)
+
+    def discard(self, key):
+        with self.lock_for(key).write(), self._lock:
+            old = self._stores.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+
+    def _evict_locked(self, keep):
+        while self._stores and (len(self._stores) > self.max_entries or self._total_bytes > self.max_bytes):
+            oldest = next(iter(self._stores))
+            if oldest == keep:
+                # Never evict the entry that was just inserted, even if it alone exceeds the budget
+                if len(self._stores) == 1:
+                    break
+                self._stores.move_to_end(oldest)
+                continue
+            _, nbytes = self._stores.pop(oldest)
+            self._total_bytes -= nbytes
+            self.evictions += 1
+            logger.info(f"Evicted vector store {oldest} from memory ({nbytes} bytes)")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._stores),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,81 @@
+"""Answer cache tests: exact and semantic hits, expiry and invalidation (run with pytest)"""
+import os
+import time
+
+import numpy as np
+import pytest
+
+import app
+from answer_cache import AnswerCache
+from benchmark import write_pdf
+from offline import StubChatModel
+
+
+def test_exact_hit_after_normalization():
+    cache = AnswerCache(similarity_threshold=1.0)
+    cache.put("book", "What is paging?", {"response": "Paging maps pages to frames."})
+    assert cache.get_exact("book", "  what IS   paging ")["response"] == "Paging maps pages to frames."
+    assert cache.get_exact("other-book", "What is paging?") is None
+    assert cache.get_exact("book", "What is segmentation?") is None
+
+
+def test_semantic_hit_needs_the_threshold():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.put("book", "What is paging?", {"response": "paged"}, embedding=[1.0, 0.0, 0.0])
+    assert cache.get_similar("book", [0.99, 0.05, 0.0])["response"] == "paged"
+    assert cache.get_similar("book", [0.7, 0.7, 0.0]) is None
+    assert cache.get_similar("other-book", [1.0, 0.0, 0.0]) is None
+    assert AnswerCache(similarity_threshold=1.0).get_similar("book", [1.0, 0.0, 0.0]) is None
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1 and stats["misses"] == 2
+
+
+def test_expiry_eviction_and_invalidation(monkeypatch):
+    cache = AnswerCache(max_entries=2, ttl=60)
+    cache.put("a", "q1", {"response": 1}, source="a.pdf")
+    cache.put("b", "q2", {"response": 2}, source="b.pdf")
+    cache.put("b", "q3", {"response": 3}, source="b.pdf")
+    assert cache.get_exact("a", "q1") is None and cache.stats()["evictions"] == 1
+
+    assert cache.invalidate(source="b.pdf") == 2
+    assert cache.get_exact("b", "q2") is None
+
+    cache.put("c", "q4", {"response": 4}, embedding=np.ones(3))
+    now = time.time()
+    monkeypatch.setattr("answer_cache.time.time", lambda: now + 61)
+    assert cache.get_exact("c", "q4") is None and cache.stats()["expirations"] == 1
+
+
+@pytest.fixture
+def answering(rag):
+    rag.llm_clients.set_chat_model(app.CHAT_MODEL, app.CHAT_TEMPERATURE, StubChatModel())
+    path = os.path.join(rag.catalog.folder, "book.pdf")
+    write_pdf(path, [["paging maps virtual pages to physical frames " * 8]] * 3)
+    assert rag.load_and_process_pdf(path)
+    return rag, path
+
+
+def test_answers_are_cached_per_retrieval_mode(answering):
+    rag, path = answering
+    assert "cache_hit" not in rag.query("What is paging?", path, "hybrid")
+    assert rag.query("what is paging", path, "hybrid")["cache_hit"] == "exact"
+    # Lexical retrieval may pick other chunks, so it does not reuse the hybrid answer
+    assert "cache_hit" not in rag.query("What is paging?", path, "lexical")
+    assert rag.query("What is paging?", path, "lexical")["cache_hit"] == "exact"
+
+
+def test_changed_pdf_does_not_reuse_cached_answers(answering):
+    rag, path = answering
+    old_key = rag.resolve_index(path)
+    rag.query("What is paging?", path)
+    assert rag.answer_cache.stats()["entries"] == 1
+
+    write_pdf(path, [["segmentation splits memory into variable sized segments " * 8]] * 3)
+    mtime = os.stat(path).st_mtime_ns + 1_000_000_000
+    os.utime(path, ns=(mtime, mtime))
+    assert rag.load_and_process_pdf(path)
+    assert rag.resolve_index(path) != old_key
+    # Answers for the old build are dropped when the new one is built
+    assert rag.answer_cache.stats()["entries"] == 0
+    response = rag.query("What is paging?", path)
+    assert "cache_hit" not in response and "segmentation" in response["answer"]
@@ -0,0 +1,40 @@
+"""Chunking tests: streamed page chunking (run with pytest)"""
+import pytest
+
+from benchmark import synthetic_pages
+from chunking import HEADING_PATTERN, ChunkingConfig, chunk_pages
+
+
+def page_stream(pages=40, words_per_page=300):
+    for number, lines in enumerate(synthetic_pages(pages, words_per_page), 1):
+        yield number, "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("boundary", ["none", "heading"])
+def test_streamed_chunks_point_into_the_document(boundary):
+    config = ChunkingConfig(chunk_size=500, chunk_overlap=50, boundary=boundary)
+    pages = list(page_stream())
+    document = "".join(text for _, text in pages)
+    page_starts = [sum(len(text) for _, text in pages[:n]) for n in range(len(pages))]
+
+    texts, metadatas = chunk_pages(page_stream(), config)
+    assert len(texts) > len(pages)
+    covered = 0
+    for text, metadata in zip(texts, metadatas):
+        start = metadata["start_index"]
+        assert len(text) <= config.chunk_size
+        assert document[start:start + len(text)] == text
+        assert page_starts[metadata["page_start"] - 1] <= start
+        assert page_starts[metadata["page_end"] - 1] < start + len(text)
+        # Chunks overlap or touch, so no text is skipped between them
+        assert start <= covered + 1
+        covered = max(covered, start + len(text))
+    assert covered >= len(document.rstrip())
+
+
+def test_heading_boundaries_hold_across_pages():
+    # Pages that end in a heading, whose section starts on the next page
+    pages = [(number, text + "\nCHAPTER 99\n" if number % 7 == 0 else text) for number, text in page_stream()]
+    texts, _ = chunk_pages(iter(pages), ChunkingConfig(chunk_size=500, chunk_overlap=50, boundary="heading"))
+    for text in texts:
+        assert not [match for match in HEADING_PATTERN.finditer(text) if match.start() > 0]
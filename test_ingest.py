@@ -0,0 +1,46 @@
+"""Checkpoint resume tests for the embedding pipeline (run with pytest)"""
+import os
+
+import numpy as np
+
+from ingest import EmbeddingPipeline
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_resume_after_crashed_save(tmp_path):
+    texts = [f"chunk {'x' * n}" for n in range(10)]
+    first = EmbeddingPipeline(CountingEmbeddings(), batch_size=4, max_concurrency=1, checkpoint_dir=str(tmp_path))
+    expected = first.embed(texts, checkpoint_key="book")
+    path = tmp_path / "book"
+
+    # A crash between writing a batch and renaming it leaves a temporary file behind,
+    # in the current and in the earlier naming, with the batch itself missing
+    os.remove(path / "batch-000001.npy")
+    np.save(path / ".tmp-batch-000001-1.npy", np.zeros((4, 2), dtype=np.float32))
+    np.save(path / "batch-000001.tmp.npy", np.zeros((4, 2), dtype=np.float32))
+
+    embeddings = CountingEmbeddings()
+    resumed = EmbeddingPipeline(embeddings, batch_size=4, max_concurrency=1, checkpoint_dir=str(tmp_path))
+    np.testing.assert_array_equal(resumed.embed(texts, checkpoint_key="book"), expected)
+    assert embeddings.calls == 1
+    assert sorted(os.listdir(path)) == ["batch-000000.npy", "batch-000001.npy", "batch-000002.npy", "manifest.json"]
+
+
+def test_resume_skips_unreadable_batch(tmp_path):
+    texts = [f"chunk {n}" for n in range(8)]
+    pipeline = EmbeddingPipeline(CountingEmbeddings(), batch_size=4, max_concurrency=1, checkpoint_dir=str(tmp_path))
+    expected = pipeline.embed(texts, checkpoint_key="book")
+    (tmp_path / "book" / "batch-000000.npy").write_bytes(b"truncated")
+
+    embeddings = CountingEmbeddings()
+    resumed = EmbeddingPipeline(embeddings, batch_size=4, max_concurrency=1, checkpoint_dir=str(tmp_path))
+    np.testing.assert_array_equal(resumed.embed(texts, checkpoint_key="book"), expected)
+    assert embeddings.calls == 1
@@ -0,0 +1,168 @@
+"""Library index tests: incremental updates of the catalog-wide index (run with pytest)"""
+import os
+
+import pytest
+
+import app
+from benchmark import write_pdf
+from retrieval import store_metadatas, store_texts
+
+BOOK_A = "IV SEM- (COMP) 'Operating Systems' by A. Author.pdf"
+BOOK_B = "IV SEM- (COMP) 'Computer Networks' by B. Author.pdf"
+
+
+def book_pages(word, pages=3):
+    return [[f"CHAPTER {page + 1}", " ".join([word, "kernel", "scheduler"] * 20)] for page in range(pages)]
+
+
+@pytest.fixture(autouse=True)
+def incremental_updates(monkeypatch):
+    # Updates stay incremental unless a test asks for compaction
+    monkeypatch.setattr(app, "LIBRARY_COMPACT_RATIO", 100.0)
+
+
+class CountingEmbeddings:
+    """Wraps the embeddings the pipeline uses, recording every text it embeds"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return self.embeddings.embed_documents(texts)
+
+
+def write_book(rag, filename, word, pages=3):
+    path = os.path.join(rag.catalog.folder, filename)
+    write_pdf(path, book_pages(word, pages))
+    return path
+
+
+def later(path):
+    """Move a file's or folder's mtime a second on, as if it changed after the last build
+
+    Timestamps only advance once per clock tick, which a fast test can finish within.
+    """
+    mtime = os.stat(path).st_mtime_ns + 1_000_000_000
+    os.utime(path, ns=(mtime, mtime))
+
+
+def live_chunks(rag, index_key):
+    """(filename, text) of every chunk of a library index that searches can return"""
+    store = rag.get_vector_store(index_key)
+    return [(os.path.basename(metadata["source_pdf"]), text)
+            for text, metadata in zip(store_texts(store), store_metadatas(store)) if not metadata.get("deleted")]
+
+
+def library_texts(rag, index_key):
+    return " ".join(text for _, text in live_chunks(rag, index_key))
+
+
+def count_embeddings(rag):
+    counter = CountingEmbeddings(rag.embedding_pipeline.embeddings)
+    rag.embedding_pipeline.embeddings = counter
+    return counter
+
+
+def test_book_edited_in_place_outdates_library(rag):
+    folder = rag.catalog.folder
+    path = os.path.join(folder, BOOK_A)
+    write_pdf(path, book_pages("paging"))
+    first = rag.build_library()
+    assert rag.resolve_library() == first and rag.library_is_current(first)
+
+    # A new edition copied over the old file changes the file, but not the folder's mtime
+    folder_mtime = os.stat(folder).st_mtime_ns
+    write_pdf(path, book_pages("semaphore"))
+    later(path)
+    os.utime(folder, ns=(folder_mtime, folder_mtime))
+
+    assert not rag.library_is_current(first)
+    second = rag.build_library()
+    assert second != first and rag.resolve_library() == second
+    assert "semaphore" in library_texts(rag, second)
+    assert "paging" not in library_texts(rag, second)
+
+
+def test_only_questions_start_a_stale_library_update(rag):
+    path = os.path.join(rag.catalog.folder, BOOK_A)
+    write_pdf(path, book_pages("paging"))
+    published = rag.build_library()
+    updates = []
+    rag.on_library_stale = lambda: updates.append(True)
+    write_book(rag, BOOK_B, "deadlock")
+    later(rag.catalog.folder)
+
+    assert rag.resolve_library() == published
+    assert updates == []
+    assert rag.resolve_library(start_update=True) == published
+    assert rag.resolve_library(start_update=True) == published
+    assert updates == [True]
+
+
+def test_added_book_is_appended_without_embedding_the_others(rag):
+    write_book(rag, BOOK_A, "paging")
+    first = rag.build_library()
+    counter = count_embeddings(rag)
+    write_book(rag, BOOK_B, "routing")
+    later(rag.catalog.folder)
+
+    second = rag.build_library()
+    meta = rag.index_store.read_metadata(second)
+    assert sorted(meta["books"]) == sorted([BOOK_A, BOOK_B])
+    assert counter.texts and all("routing" in text for text in counter.texts)
+    assert sorted({filename for filename, _ in live_chunks(rag, second)}) == sorted([BOOK_A, BOOK_B])
+    assert meta["chunk_count"] == len(live_chunks(rag, second))
+    # The replaced build is deleted once the update is published
+    assert rag.index_store.read_pointer("library") == second
+    assert not rag.index_store.exists(first)
+
+
+def test_removed_book_is_deleted_by_id(rag):
+    write_book(rag, BOOK_A, "paging")
+    removed = write_book(rag, BOOK_B, "routing")
+    first = rag.build_library()
+    book_index = rag.book_index_key(next(e for e in rag.catalog.entries() if e["filename"] == BOOK_B))
+    os.remove(removed)
+    later(rag.catalog.folder)
+
+    second = rag.build_library()
+    meta = rag.index_store.read_metadata(second)
+    assert meta["books"] == [BOOK_A]
+    assert meta["deleted_chunks"] > 0
+    assert {filename for filename, _ in live_chunks(rag, second)} == {BOOK_A}
+    assert rag.get_vector_store(second).index.ntotal == meta["chunk_count"] + meta["deleted_chunks"]
+    # The removed book's own index goes with the library build it was part of
+    assert not rag.index_store.exists(book_index) and not rag.index_store.exists(first)
+
+
+def test_renamed_book_is_not_embedded_again(rag):
+    write_book(rag, BOOK_A, "paging")
+    rag.build_library()
+    counter = count_embeddings(rag)
+    renamed = BOOK_A.replace("A. Author", "A. Writer")
+    os.rename(os.path.join(rag.catalog.folder, BOOK_A), os.path.join(rag.catalog.folder, renamed))
+    later(rag.catalog.folder)
+
+    second = rag.build_library()
+    assert counter.texts == []
+    assert rag.index_store.read_metadata(second)["books"] == [renamed]
+    assert {filename for filename, _ in live_chunks(rag, second)} == {renamed}
+
+
+def test_churn_compacts_the_library(rag, monkeypatch):
+    write_book(rag, BOOK_A, "paging")
+    removed = write_book(rag, BOOK_B, "routing")
+    rag.build_library()
+    monkeypatch.setattr(app, "LIBRARY_COMPACT_RATIO", 0.25)
+    counter = count_embeddings(rag)
+    os.remove(removed)
+    later(rag.catalog.folder)
+
+    second = rag.build_library()
+    meta = rag.index_store.read_metadata(second)
+    assert meta["deleted_chunks"] == 0 and meta["churn"] == 0
+    assert rag.get_vector_store(second).index.ntotal == meta["chunk_count"] == len(live_chunks(rag, second))
+    assert {filename for filename, _ in live_chunks(rag, second)} == {BOOK_A}
+    assert counter.texts == []
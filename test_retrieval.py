@@ -0,0 +1,71 @@
+"""Retrieval tests: BM25 ranking and reciprocal rank fusion (run with pytest)"""
+import numpy as np
+import pytest
+
+from bm25 import BM25Index, tokenize
+from retrieval import reciprocal_rank_fusion
+
+CHUNKS = [
+    "the scheduler picks the next process to run on the cpu",
+    "paging maps virtual pages to physical frames of memory",
+    "the 8051 microcontroller has four register banks",
+    "a deadlock needs mutual exclusion hold and wait no preemption and circular wait",
+    "memory memory memory memory memory memory memory memory",
+    "c++ templates are expanded by the compiler",
+]
+
+
+def test_tokenize_keeps_technical_terms():
+    assert tokenize("What is the 8051 and how does C++ use TCP/IP?") == ["8051", "c++", "use", "tcp", "ip"]
+
+
+def test_bm25_ranks_exact_and_rare_terms_first():
+    index = BM25Index.build(CHUNKS)
+    assert index.search("8051 register", k=3)[0][0] == 2
+    assert index.search("c++ compiler", k=3)[0][0] == 5
+    # A rare term outweighs a common one repeated across the chunk
+    assert index.search("virtual memory", k=3)[0][0] == 1
+    assert index.search("unrelated words only", k=3) == []
+
+
+def test_bm25_search_within_positions():
+    index = BM25Index.build(CHUNKS)
+    hits = index.search("memory", k=10, positions=np.asarray([1, 3], dtype=np.int64))
+    assert [position for position, _ in hits] == [1]
+    assert index.search("memory", k=10, positions=np.asarray([], dtype=np.int64)) == []
+
+
+def test_bm25_extend_and_reload_match_a_full_build(tmp_path):
+    full = BM25Index.build(CHUNKS)
+    extended = BM25Index.build(CHUNKS[:3])
+    extended.extend(CHUNKS[3:])
+    extended.save(str(tmp_path / "bm25.npz"))
+    loaded = BM25Index.load(str(tmp_path / "bm25.npz"))
+    for query in ("memory frames", "deadlock wait", "register cpu"):
+        expected = full.search(query, k=6)
+        for index in (extended, loaded):
+            hits = index.search(query, k=6)
+            assert [p for p, _ in hits] == [p for p, _ in expected]
+            np.testing.assert_allclose([s for _, s in hits], [s for _, s in expected], rtol=1e-5)
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    vector = [7, 3, 5, 1]
+    lexical = [3, 9, 1]
+    fused = reciprocal_rank_fusion([vector, lexical], k=60)
+    positions = [position for position, _ in fused]
+    # Found by both rankers, near the top of each
+    assert positions[0] == 3
+    assert positions.index(1) < positions.index(5)
+    assert sorted(positions) == [1, 3, 5, 7, 9]
+    assert dict(fused)[3] == pytest.approx(1 / 62 + 1 / 61)
+    assert [score for _, score in fused] == sorted((score for _, score in fused), reverse=True)
+
+
+@pytest.mark.parametrize("mode", ["hybrid", "lexical", "vector"])
+def test_search_finds_the_chunk_with_the_asked_term(rag, mode):
+    rag.create_vector_store(CHUNKS, "retrieval-test", chunk_metadatas=[{"position": n} for n in range(len(CHUNKS))])
+    question = "How many register banks does the 8051 have?"
+    embedding = None if mode == "lexical" else rag.embed_question(question)
+    docs = rag.search("retrieval-test", question, mode, embedding)
+    assert docs[0].metadata["position"] == 2
@@ -0,0 +1,109 @@
+"""Single-flight tests: coalescing of identical in-flight work (run with pytest)"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def run_together(count, fn):
+    """Call fn() from count threads at once; returns (results, errors)"""
+    results, errors = [], []
+    start = threading.Barrier(count, timeout=5)
+
+    def call():
+        start.wait()
+        try:
+            results.append(fn())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"answer": 42}
+
+    results, errors = run_together(8, lambda: flight.do("question", work))
+    assert errors == [] and len(calls) == 1
+    assert len(results) == 8 and all(result is results[0] for result in results)
+    # Once finished, the next call runs the work again
+    flight.do("question", work)
+    assert len(calls) == 2
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight("test")
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.1)
+        raise ValueError("index build failed")
+
+    results, errors = run_together(6, lambda: flight.do("book", work))
+    assert results == [] and len(calls) == 1
+    assert len(errors) == 6 and all(isinstance(e, ValueError) for e in errors)
+    with pytest.raises(ValueError):
+        flight.do("book", work)
+    assert len(calls) == 2
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight("test")
+    calls = []
+    _, errors = run_together(4, lambda: flight.do(threading.get_ident(), lambda: calls.append(1)))
+    assert errors == [] and len(calls) == 4
+
+
+def test_async_calls_share_one_execution_and_its_error():
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def work(fail):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        if fail:
+            raise RuntimeError("generation failed")
+        return "answer"
+
+    async def main():
+        answers = await asyncio.gather(*[flight.do("q", lambda: work(False)) for _ in range(5)])
+        failures = await asyncio.gather(*[flight.do("q", lambda: work(True)) for _ in range(5)],
+                                        return_exceptions=True)
+        return answers, failures
+
+    answers, failures = asyncio.run(main())
+    assert answers == ["answer"] * 5
+    assert len(failures) == 5 and all(isinstance(e, RuntimeError) for e in failures)
+    assert len(calls) == 2
+
+
+def test_async_cancelled_caller_does_not_cancel_the_others():
+    flight = AsyncSingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("q", work))
+        second = asyncio.ensure_future(flight.do("q", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(main()) == ("answer", True)
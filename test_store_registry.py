@@ -0,0 +1,140 @@
+"""Vector store registry tests: reader/writer locking and LRU eviction (run with pytest)"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from store_registry import ReadWriteLock, VectorStoreRegistry
+
+
+def loader_for(store, nbytes=1, calls=None, delay=0.0):
+    def loader():
+        if calls is not None:
+            calls.append(store)
+        time.sleep(delay)
+        return store, nbytes
+    return loader
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(4, timeout=5)
+
+    def read():
+        with lock.read():
+            # Every reader must be inside at once to pass the barrier
+            inside.wait()
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: read(), range(4)))
+
+
+def test_waiting_writer_blocks_new_readers():
+    lock = ReadWriteLock()
+    events = []
+    reader_in = threading.Event()
+    release_reader = threading.Event()
+
+    def first_reader():
+        with lock.read():
+            reader_in.set()
+            release_reader.wait(5)
+            events.append("first reader out")
+
+    def writer():
+        with lock.write():
+            events.append("writer")
+
+    def late_reader():
+        with lock.read():
+            events.append("late reader")
+
+    threads = [threading.Thread(target=first_reader)]
+    threads[0].start()
+    reader_in.wait(5)
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    while not lock._waiting_writers:
+        time.sleep(0.001)
+    threads.append(threading.Thread(target=late_reader))
+    threads[2].start()
+    time.sleep(0.05)
+    assert events == []
+    release_reader.set()
+    for thread in threads:
+        thread.join(5)
+    assert events == ["first reader out", "writer", "late reader"]
+
+
+def test_concurrent_misses_load_once():
+    registry = VectorStoreRegistry(max_entries=4)
+    calls = []
+    with ThreadPoolExecutor(8) as pool:
+        stores = list(pool.map(lambda _: registry.get("a", loader_for("store-a", calls=calls, delay=0.05)), range(8)))
+    assert stores == ["store-a"] * 8
+    assert calls == ["store-a"]
+    assert registry.stats()["misses"] == 1 and registry.stats()["hits"] == 7
+
+
+def test_replacing_a_store_waits_for_its_readers():
+    registry = VectorStoreRegistry(max_entries=4)
+    events = []
+    reading = threading.Event()
+    release = threading.Event()
+
+    def reader():
+        with registry.reading("a", loader_for("old")) as store:
+            reading.set()
+            release.wait(5)
+            events.append(("read", store))
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    reading.wait(5)
+    writer = threading.Thread(target=lambda: (registry.put("a", "new", 1), events.append(("put", "new"))))
+    writer.start()
+    time.sleep(0.05)
+    assert events == []
+    release.set()
+    thread.join(5)
+    writer.join(5)
+    assert events == [("read", "old"), ("put", "new")]
+    with registry.reading("a", loader_for("unused")) as store:
+        assert store == "new"
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    registry = VectorStoreRegistry(max_entries=2, max_bytes=100)
+    registry.get("a", loader_for("A", 10))
+    registry.get("b", loader_for("B", 10))
+    registry.get("a", loader_for("unused"))  # a is now the most recently used
+    registry.get("c", loader_for("C", 10))
+    assert registry.peek("b") is None and registry.peek("a") == "A" and registry.peek("c") == "C"
+
+    # One store over the byte budget evicts the others but is kept itself
+    registry.get("d", loader_for("D", 500))
+    assert registry.peek("d") == "D" and registry.peek("a") is None and registry.peek("c") is None
+    assert registry.stats()["evictions"] == 3
+    assert registry.stats()["bytes"] == 500
+
+
+def test_eviction_under_concurrent_readers():
+    registry = VectorStoreRegistry(max_entries=2)
+    calls = []
+    errors = []
+
+    def read(n):
+        key = f"k{n % 5}"
+        try:
+            with registry.reading(key, loader_for(key, calls=calls)) as store:
+                # A store keeps working for its reader even if it is evicted meanwhile
+                assert store == key
+                time.sleep(0.001)
+        except Exception as e:
+            errors.append(e)
+
+    with ThreadPoolExecutor(16) as pool:
+        list(pool.map(read, range(400)))
+    assert errors == []
+    stats = registry.stats()
+    assert stats["entries"] <= 2
+    assert stats["misses"] == len(calls) and stats["evictions"] == len(calls) - stats["entries"]
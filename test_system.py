@@ -18,7 +18,7 @@ def test_endpoint(name, url, method="GET", data=None):
         else:
             response = requests.post(url, json=data, timeout=30)
         
-        if response.status_code == 200:
+        if response.status_code in (200, 202):
             result = response.json()
             print(f"✅ {name} - Success")
             if "error" in result:
@@ -32,6 +32,19 @@ def test_endpoint(name, url, method="GET", data=None):
         print(f"❌ {name} - Exception: {str(e)}")
         return False, None
 
+def wait_for_job(job_id, timeout=600):
+    """Poll a background ingestion job until it finishes"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.get(f"{BASE_URL}/jobs/{job_id}", timeout=10)
+        job = response.json()
+        progress = job.get('progress', {})
+        print(f"   ⏳ {job.get('status')}: {progress.get('pages_extracted', 0)} pages, {progress.get('chunks_embedded', 0)}/{progress.get('total_chunks', '?')} chunks")
+        if job.get('status') in ("completed", "failed"):
+            return job
+        time.sleep(2)
+    return {"status": "timeout"}
+
 def main():
     print("🚀 Testing EduVision RAG System")
     print("=" * 50)
@@ -64,6 +77,11 @@ def main():
         "author": "B. Ram"
     }
     success, result = test_endpoint("Load PDF", f"{BASE_URL}/load-pdf", "POST", pdf_data)
+    if success and result.get('job_id'):
+        job = wait_for_job(result['job_id'])
+        success = job.get('status') == "completed"
+        if not success:
+            print(f"   ⚠️  Ingestion {job.get('status')}: {job.get('error')}")
     if success:
         print(f"   📁 Loaded: {result.get('pdf_path', 'Unknown')}")
     
@@ -0,0 +1,80 @@
+import logging
+import mmap
+import os
+import threading
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PageTextStore:
+    """Extracted page text of each PDF, stored once per content hash
+
+    A PDF is kept as two files: <hash>.pages holds one zlib-compressed blob
+    per page, back to back, and <hash>.offsets.npy holds the n + 1 byte
+    offsets of those blobs. Both are memory-mapped when read, so a single page
+    can be read without decompressing the rest. The offsets file is written
+    last and marks a complete extraction.
+    """
+
+    def __init__(self, root, compression_level=6):
+        self.root = root
+        self.compression_level = compression_level
+
+    def _paths(self, content_hash):
+        base = os.path.join(self.root, content_hash)
+        return f"{base}.pages", f"{base}.offsets.npy"
+
+    def has(self, content_hash):
+        return os.path.exists(self._paths(content_hash)[1])
+
+    def iter_pages(self, content_hash, start=1, end=None):
+        """Yield (page_number, text) for pages start..end (inclusive), numbering pages from 1"""
+        pages_path, offsets_path = self._paths(content_hash)
+        offsets = np.load(offsets_path, mmap_mode="r")
+        end = len(offsets) - 1 if end is None else min(end, len(offsets) - 1)
+        if os.path.getsize(pages_path) == 0:
+            # mmap cannot map an empty file; every page is empty
+            for page_number in range(start, end + 1):
+                yield page_number, ""
+            return
+        with open(pages_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as blobs:
+            for page_number in range(start, end + 1):
+                blob = blobs[int(offsets[page_number - 1]):int(offsets[page_number])]
+                yield page_number, zlib.decompress(blob).decode("utf-8")
+
+    def write_through(self, content_hash, pages):
+        """Yield pages from an iterator of (page_number, text) while storing them
+
+        The extraction is published only if the iterator is consumed to the end.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        pages_path, offsets_path = self._paths(content_hash)
+        suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+        offsets = [0]
+        complete = False
+        try:
+            with open(pages_path + suffix, "wb") as f:
+                for page_number, text in pages:
+                    if page_number != len(offsets):
+                        raise ValueError(f"Pages must be stored in order, got page {page_number}")
+                    blob = zlib.compress(text.encode("utf-8"), self.compression_level)
+                    f.write(blob)
+                    offsets.append(offsets[-1] + len(blob))
+                    yield page_number, text
+            with open(offsets_path + suffix, "wb") as f:
+                np.save(f, np.asarray(offsets, dtype=np.uint64))
+            os.replace(pages_path + suffix, pages_path)
+            os.replace(offsets_path + suffix, offsets_path)
+            complete = True
+            logger.info(f"Stored text of {len(offsets) - 1} pages for {content_hash[:12]}")
+        finally:
+            if not complete:
+                for path in (pages_path + suffix, offsets_path + suffix):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def nbytes(self, content_hash):
+        return sum(os.path.getsize(path) for path in self._paths(content_hash))
@@ -0,0 +1,163 @@
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+# k-means wants roughly this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+# Product quantizers learn 256 centroids per sub-vector
+PQ_MIN_TRAINING_POINTS = 256 * 4
+
+
+def default_nlist(count):
+    """Number of IVF lists for count vectors: about 4 * sqrt(n), limited by the training data"""
+    return max(1, min(int(4 * math.sqrt(count)), count // MIN_POINTS_PER_CENTROID))
+
+
+def default_pq_m(dimension, bytes_per_vector=None):
+    """Largest sub-quantizer count that divides the dimension and fits the code size (default d / 8)"""
+    target = bytes_per_vector or max(1, dimension // 8)
+    for m in range(min(target, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+class IndexSpec:
+    """Which FAISS index a collection is built with and how it is searched
+
+    "flat" is exact search. "hnsw" is a graph index that needs no training.
+    "ivf" clusters vectors into nlist inverted lists and scans nprobe of them;
+    "ivfpq" also compresses each vector to pq_m bytes. IVF types fall back to
+    a simpler index when there are too few vectors to train on.
+    """
+
+    def __init__(self, index_type="flat", nlist=None, pq_m=None, hnsw_m=32, nprobe=8, ef_search=64):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+        self.index_type = index_type
+        self.nlist = int(nlist) if nlist else None
+        self.pq_m = int(pq_m) if pq_m else None
+        self.hnsw_m = int(hnsw_m)
+        self.nprobe = int(nprobe)
+        self.ef_search = int(ef_search)
+
+    def to_dict(self):
+        """Build parameters, which change the contents of an index (search parameters do not)
+
+        Flat indexes contribute nothing, so keys of builds that predate index
+        types stay valid.
+        """
+        if self.index_type == "flat":
+            return {}
+        params = {"index_type": self.index_type}
+        if self.index_type == "hnsw":
+            params["hnsw_m"] = self.hnsw_m
+        if self.index_type in ("ivf", "ivfpq") and self.nlist:
+            params["nlist"] = self.nlist
+        if self.index_type == "ivfpq" and self.pq_m:
+            params["pq_m"] = self.pq_m
+        return params
+
+    def effective_type(self, count):
+        """The index type actually built for count vectors"""
+        index_type = self.index_type
+        if index_type == "ivfpq" and count < PQ_MIN_TRAINING_POINTS:
+            index_type = "ivf"
+        if index_type in ("ivf", "ivfpq") and self._nlist(count) < 2:
+            index_type = "flat"
+        return index_type
+
+    def _nlist(self, count):
+        return min(self.nlist or default_nlist(count), max(1, count // MIN_POINTS_PER_CENTROID))
+
+    def factory_string(self, count, dimension):
+        """The faiss.index_factory description used for count vectors of a dimension"""
+        index_type = self.effective_type(count)
+        nlist = self._nlist(count)
+        if index_type == "hnsw":
+            return f"HNSW{self.hnsw_m}"
+        if index_type == "ivf":
+            return f"IVF{nlist},Flat"
+        if index_type == "ivfpq":
+            return f"IVF{nlist},PQ{self.pq_m or default_pq_m(dimension)}"
+        return "Flat"
+
+    def train(self, vectors):
+        """Create an empty FAISS index trained on vectors, returning (index, info) describing it"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        count, dimension = vectors.shape
+        description = self.factory_string(count, dimension)
+        if self.effective_type(count) != self.index_type:
+            logger.info(f"Only {count} vectors, building {description} instead of a {self.index_type} index")
+
+        import faiss
+
+        index = faiss.index_factory(dimension, description)
+        if hasattr(index, "do_polysemous_training"):
+            # Only needed for Hamming-distance search, and it dominates training time
+            index.do_polysemous_training = False
+        if not index.is_trained:
+            index.train(vectors)
+        self.configure(index)
+        return index, {"index_type": self.index_type, "faiss_index": description, "trained_on": count}
+
+    def configure(self, index):
+        """Apply search-time parameters to a built or loaded index"""
+        import faiss
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = min(self.nprobe, ivf.nlist)
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = self.ef_search
+        return index
+
+
+def spec_for(override, default):
+    """Index spec for one document: the default with the index keys of its override applied"""
+    values = {k: v for k, v in (override or {}).items()
+              if k in ("index_type", "nlist", "pq_m", "hnsw_m")}
+    if not values:
+        return default
+    merged = dict(index_type=default.index_type, nlist=default.nlist, pq_m=default.pq_m, hnsw_m=default.hnsw_m,
+                  nprobe=default.nprobe, ef_search=default.ef_search)
+    merged.update(values)
+    return IndexSpec(**merged)
+
+
+def build_faiss_store(embeddings, texts, vectors, metadatas, spec, ids=None):
+    """A langchain FAISS store over precomputed vectors, using the index type of spec"""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    index, info = spec.train(vectors)
+    store = FAISS(embeddings, index, InMemoryDocstore(), {})
+    store.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+    return store, info
+
+
+def reconstruct_vectors(index):
+    """Original vectors of an index that stores them losslessly, or None
+
+    Lets an index be rebuilt with another type without embedding the chunks again.
+    """
+    import faiss
+    description = type(index).__name__
+    try:
+        if isinstance(index, (faiss.IndexFlat, faiss.IndexHNSWFlat)):
+            return index.reconstruct_n(0, index.ntotal)
+        if isinstance(index, faiss.IndexIVFFlat):
+            index.make_direct_map()
+            return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError as e:
+        logger.warning(f"Could not reconstruct vectors from {description}: {str(e)}")
+    return None
+
+
+def index_nbytes(index):
+    """Serialized size of a FAISS index, close to its resident memory"""
+    import faiss
+    return int(faiss.serialize_index(index).nbytes)